@@ -0,0 +1,261 @@
+import datetime
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from atomic_file import replace_file
+from download import CHUNK_SIZE, is_zip_intact
+from raw_cache import INDEX_SUFFIX, RAW_CACHE_SUFFIX
+
+# Manifest of archived files, kept in the archive directory
+MANIFEST_FILENAME = "manifest.json"
+OBJECTS_DIRECTORY = "objects"
+# Date at the end of an ADM daily file name
+FILE_DATE_PATTERN = re.compile(r'_(\d{8})\.zip$')
+# Archive size budget; the oldest days are evicted once the archived zips take more than this
+ARCHIVE_MAX_BYTES = 2 * 1024 ** 3
+# Days archived zips are kept for, or None to keep them until the size budget is reached
+ARCHIVE_RETENTION_DAYS = None
+# Extracted LrpRate files kept for the most recently extracted zips; the rest are rebuilt from their zip on demand
+RAW_CACHE_KEEP = 2
+
+# Serializes manifest updates from concurrent archiving threads
+_manifest_lock = threading.Lock()
+
+
+def file_sha256(filepath):
+    """
+    Calculate the SHA-256 of a file.
+
+    Args:
+        filepath (str): Path to the file.
+
+    Returns:
+        str: Hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def object_path(archive_directory, digest):
+    """
+    Build the path a file with the given digest is archived under.
+
+    Args:
+        archive_directory (str): Root directory of the archive.
+        digest (str): SHA-256 hex digest of the file.
+
+    Returns:
+        str: Object path.
+    """
+    return os.path.join(archive_directory, OBJECTS_DIRECTORY, digest[:2], f"{digest}.zip")
+
+
+def load_manifest(archive_directory):
+    """
+    Load the archive manifest.
+
+    Args:
+        archive_directory (str): Root directory of the archive.
+
+    Returns:
+        dict: Entries keyed by file name.
+    """
+    try:
+        with open(os.path.join(archive_directory, MANIFEST_FILENAME), 'r') as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(archive_directory, manifest):
+    """
+    Write the archive manifest.
+
+    Args:
+        archive_directory (str): Root directory of the archive.
+        manifest (dict): Entries keyed by file name.
+    """
+    def write(temp_path):
+        with open(temp_path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+
+    replace_file(os.path.join(archive_directory, MANIFEST_FILENAME), write)
+
+
+def link_or_copy(source, destination):
+    """
+    Make destination the same file as source, copying it where hard links are not supported.
+
+    Args:
+        source (str): Existing file.
+        destination (str): Path to create or replace.
+    """
+    def link(temp_path):
+        try:
+            os.link(source, temp_path)
+        except OSError:
+            shutil.copy2(source, temp_path)
+
+    replace_file(destination, link)
+
+
+def file_date(filename):
+    """
+    Get the date an ADM daily file is for from its name.
+
+    Args:
+        filename (str): File name, e.g. '2024_ADMLivestockLrp_Daily_20231214.zip'.
+
+    Returns:
+        str: ISO date, or today's date if the name holds none.
+    """
+    match = FILE_DATE_PATTERN.search(filename)
+    if match is None:
+        return datetime.date.today().isoformat()
+    return datetime.datetime.strptime(match.group(1), "%Y%m%d").date().isoformat()
+
+
+def archive_zip(archive_directory, zip_path, url=None):
+    """
+    Store a downloaded zip in the archive under its content hash.
+
+    The zip is CRC-checked before it is archived. Identical files are stored
+    once, and the downloaded copy is replaced by a hard link to the archived
+    object, so the download directory holds no second copy.
+
+    Args:
+        archive_directory (str): Root directory of the archive.
+        zip_path (str): Downloaded zip.
+        url (str): URL the zip was downloaded from, recorded so an evicted day can be fetched again.
+
+    Returns:
+        str: Path of the archived object.
+    """
+    filename = os.path.basename(zip_path)
+    entry = load_manifest(archive_directory).get(filename)
+    if entry and not entry.get('evicted'):
+        path = object_path(archive_directory, entry['sha256'])
+        if os.path.exists(path) and os.path.samefile(path, zip_path):
+            return path
+
+    if not is_zip_intact(zip_path):
+        raise Exception(f"File '{filename}' failed the zip CRC check and was not archived.")
+    digest = file_sha256(zip_path)
+    path = object_path(archive_directory, digest)
+
+    # The checks above read the whole zip, so only linking and the manifest update are serialized
+    with _manifest_lock:
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            link_or_copy(zip_path, path)
+        if not os.path.samefile(path, zip_path):
+            link_or_copy(path, zip_path)
+
+        manifest = load_manifest(archive_directory)
+        manifest[filename] = {
+            'sha256': digest,
+            'size': os.path.getsize(path),
+            'url': url or manifest.get(filename, {}).get('url'),
+            'date': file_date(filename),
+            'archived_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'evicted': False,
+        }
+        save_manifest(archive_directory, manifest)
+    return path
+
+
+def remove_files(paths):
+    """
+    Remove files, skipping any that are gone or still in use.
+
+    Args:
+        paths (list): Files to remove.
+
+    Returns:
+        int: Bytes freed.
+    """
+    freed = 0
+    for path in paths:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            freed += size
+        except OSError:
+            continue
+    return freed
+
+
+def prune(archive_directory, save_directory, max_bytes=ARCHIVE_MAX_BYTES, retention_days=ARCHIVE_RETENTION_DAYS,
+          raw_cache_keep=RAW_CACHE_KEEP):
+    """
+    Keep the download directory and the archive within their budgets.
+
+    Extracted text files are the bulk of the download directory. Only the
+    raw_cache_keep most recently extracted LrpRate files are kept;
+    other extracted text files are removed, as they can be rebuilt from
+    their zip. Archived zips older than retention_days, then the oldest ones
+    until the archive fits in max_bytes, are evicted, except the latest
+    day. Evicted days stay in the manifest with their hash and URL.
+
+    Args:
+        archive_directory (str): Root directory of the archive.
+        save_directory (str): Download directory holding the zips and extracted files.
+        max_bytes (int): Size budget of the archived zips.
+        retention_days (int): Days archived zips are kept for, or None for no limit.
+        raw_cache_keep (int): Extracted LrpRate files to keep.
+
+    Returns:
+        dict: Counts of removed 'extracted_files', 'evicted_days' and 'bytes_freed'.
+    """
+    # Extracted text and the indexes beside it, newest first
+    files = sorted(
+        (entry for entry in os.scandir(save_directory) if entry.is_file()),
+        key=lambda entry: entry.stat().st_mtime, reverse=True,
+    ) if os.path.isdir(save_directory) else []
+    kept = [entry.path for entry in files if entry.name.endswith(RAW_CACHE_SUFFIX)][:raw_cache_keep]
+    stale = [
+        entry.path for entry in files
+        if entry.name.endswith(('.txt', '.txt' + INDEX_SUFFIX)) and entry.path not in kept
+        and entry.path[:-len(INDEX_SUFFIX)] not in kept
+    ]
+    bytes_freed = remove_files(stale)
+
+    # Archiving threads may still be linking objects and updating the manifest
+    with _manifest_lock:
+        manifest = load_manifest(archive_directory)
+        live = {filename: entry for filename, entry in manifest.items() if not entry.get('evicted')}
+        # Identical files share one object, so count each object once
+        object_sizes = {entry['sha256']: entry['size'] for entry in live.values()}
+        total_bytes = sum(object_sizes.values())
+        cutoff = (datetime.date.today() - datetime.timedelta(days=retention_days)).isoformat() \
+            if retention_days is not None else None
+
+        evicted_days = 0
+        # The latest day is always kept
+        for filename, entry in sorted(live.items(), key=lambda item: (item[1]['date'], item[0]))[:-1]:
+            if total_bytes <= max_bytes and (cutoff is None or entry['date'] >= cutoff):
+                break
+            entry['evicted'] = True
+            evicted_days += 1
+            # The downloaded copy is a link to the object, so only removing the object frees space
+            remove_files([os.path.join(save_directory, filename)])
+            if not any(other['sha256'] == entry['sha256'] and not other.get('evicted') for other in live.values()):
+                bytes_freed += remove_files([object_path(archive_directory, entry['sha256'])])
+                total_bytes -= object_sizes[entry['sha256']]
+        if evicted_days:
+            save_manifest(archive_directory, manifest)
+
+        # Objects no day points to any more, e.g. a file RMA republished under the same name
+        referenced = {object_path(archive_directory, entry['sha256']) for entry in manifest.values()
+                      if not entry.get('evicted')}
+        objects_directory = os.path.join(archive_directory, OBJECTS_DIRECTORY)
+        for root, _, filenames in os.walk(objects_directory):
+            bytes_freed += remove_files([os.path.join(root, name) for name in filenames
+                                         if os.path.join(root, name) not in referenced])
+    return {'extracted_files': len(stale), 'evicted_days': evicted_days, 'bytes_freed': bytes_freed}
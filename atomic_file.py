@@ -0,0 +1,44 @@
+import os
+import threading
+
+
+def temp_path_for(path):
+    """
+    Build a temporary path next to a file that no other thread or process writes to.
+
+    The extension is kept at the end, for writers that pick the format from it.
+
+    Args:
+        path (str): File the temporary file will replace.
+
+    Returns:
+        str: Temporary path.
+    """
+    root, extension = os.path.splitext(path)
+    return f"{root}.{os.getpid()}.{threading.get_ident()}.tmp{extension}"
+
+
+def replace_file(path, write):
+    """
+    Write a file through a temporary path and move it into place.
+
+    Readers see either the previous file or the complete new one, never a
+    partial write. If writing fails, the temporary file is removed and the
+    previous file is left as it was.
+
+    Args:
+        path (str): Final path.
+        write (callable): Called with the temporary path to write to.
+
+    Returns:
+        str: The final path.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = temp_path_for(path)
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return path
@@ -0,0 +1,151 @@
+import argparse
+import asyncio
+import datetime
+import multiprocessing
+import os
+import tempfile
+import urllib.error
+from concurrent.futures import ProcessPoolExecutor
+from main import ARCHIVE_DIRECTORY, QUOTE_STORE_DIRECTORY, SAVE_DIRECTORY, build_commodity_dfs, build_url, sheet_partition_dfs
+from archive import archive_zip, prune
+from download import fetch_cached_async
+from http_pool import ConnectionPool
+from quote_store import append_quotes
+
+# Constants
+DOWNLOAD_WORKERS = 8
+
+
+def date_range(start_date_str, end_date_str):
+    """
+    List every date between two YYYYMMDD dates, inclusive.
+
+    Args:
+        start_date_str (str): First date (YYYYMMDD).
+        end_date_str (str): Last date (YYYYMMDD).
+
+    Returns:
+        list: YYYYMMDD date strings.
+    """
+    start = datetime.datetime.strptime(start_date_str, "%Y%m%d")
+    end = datetime.datetime.strptime(end_date_str, "%Y%m%d")
+    return [(start + datetime.timedelta(days=offset)).strftime("%Y%m%d") for offset in range((end - start).days + 1)]
+
+
+async def download_date(pool, date_str, save_directory, archive_directory=ARCHIVE_DIRECTORY):
+    """
+    Download the ADM daily zip for one date and archive it.
+
+    Args:
+        pool (http_pool.ConnectionPool): Connection pool to download over.
+        date_str (str): Date to download (YYYYMMDD).
+        save_directory (str): Directory to save the downloaded file.
+        archive_directory (str): Root directory of the zip archive.
+
+    Returns:
+        str: Local zip path, or None if no file was published for that date.
+    """
+    try:
+        url = build_url(date_str)
+        zip_path, _ = await fetch_cached_async(pool, url, save_directory)
+        # The CRC check reads the whole zip, so run it off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, archive_zip, archive_directory, zip_path, url)
+        return zip_path
+    except urllib.error.HTTPError as e:
+        if e.code == 404:
+            return None
+        raise
+
+
+def parse_and_store(date_str, zip_path, store_directory):
+    """
+    Build the commodity DataFrames for one date and append them to the quote store.
+
+    Runs in a worker process, so it only takes and returns plain values.
+    The LrpRate file is extracted into a temporary directory that is removed
+    once the date is stored, as a backfill never reads it again.
+
+    Args:
+        date_str (str): Date of the file (YYYYMMDD).
+        zip_path (str): Path to the ADM daily zip.
+        store_directory (str): Root directory of the quote store.
+
+    Returns:
+        int: Number of rows stored.
+    """
+    # Next to the zip rather than in the system temp directory, which may be too small
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(zip_path) or None) as cache_directory:
+        # Already inside a worker process, so build the sheets serially
+        commodity_dfs = build_commodity_dfs(zip_path, processes=1, cache_directory=cache_directory)
+    return append_quotes(store_directory, date_str, sheet_partition_dfs(commodity_dfs))
+
+
+def backfill(start_date_str, end_date_str, save_directory=SAVE_DIRECTORY, store_directory=QUOTE_STORE_DIRECTORY,
+             download_workers=DOWNLOAD_WORKERS, parse_workers=None, archive_directory=ARCHIVE_DIRECTORY):
+    """
+    Download, parse and store every ADM daily file in a date range concurrently.
+
+    Downloads run concurrently on an asyncio event loop over a bounded pool
+    of keep-alive connections; each finished zip is handed to a process pool
+    for parsing while the remaining downloads continue. Once every date is
+    done, the archive is pruned back to its budget.
+
+    Args:
+        start_date_str (str): First date (YYYYMMDD).
+        end_date_str (str): Last date (YYYYMMDD).
+        save_directory (str): Directory to save the downloaded files.
+        store_directory (str): Root directory of the quote store.
+        download_workers (int): Number of concurrent downloads (connections to the file server).
+        parse_workers (int): Number of parsing processes, or None for one per core.
+        archive_directory (str): Root directory of the zip archive.
+
+    Returns:
+        dict: Rows stored per date, with None for dates that failed or were not published.
+    """
+    async def backfill_dates(parse_pool):
+        loop = asyncio.get_running_loop()
+
+        async def backfill_date(pool, date_str):
+            try:
+                zip_path = await download_date(pool, date_str, save_directory, archive_directory)
+            except Exception as e:
+                print(f"Error downloading {date_str}: {e}")
+                return date_str, None
+            if zip_path is None:
+                print(f"No file published for {date_str}")
+                return date_str, None
+            try:
+                row_count = await loop.run_in_executor(parse_pool, parse_and_store, date_str, zip_path,
+                                                       store_directory)
+                print(f"Stored {row_count} rows for {date_str}")
+                return date_str, row_count
+            except Exception as e:
+                print(f"Error processing {date_str}: {e}")
+                return date_str, None
+
+        async with ConnectionPool(max_connections_per_host=download_workers) as pool:
+            return await asyncio.gather(
+                *(backfill_date(pool, date_str) for date_str in date_range(start_date_str, end_date_str)))
+
+    with ProcessPoolExecutor(max_workers=parse_workers) as parse_pool:
+        results = asyncio.run(backfill_dates(parse_pool))
+    pruned = prune(archive_directory, save_directory)
+    print(f"Pruned {pruned['extracted_files']} extracted files and {pruned['evicted_days']} archived days")
+    return dict(sorted(results))
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description="Backfill historical ADM livestock LRP daily files.")
+    parser.add_argument("start_date", help="First date to backfill (YYYYMMDD)")
+    parser.add_argument("end_date", help="Last date to backfill (YYYYMMDD)")
+    parser.add_argument("--save-directory", default=SAVE_DIRECTORY, help="Directory for downloaded zips")
+    parser.add_argument("--store-directory", default=QUOTE_STORE_DIRECTORY, help="Root directory of the quote store")
+    parser.add_argument("--download-workers", type=int, default=DOWNLOAD_WORKERS, help="Concurrent downloads")
+    parser.add_argument("--parse-workers", type=int, default=None, help="Parsing processes (default: one per core)")
+    args = parser.parse_args()
+
+    results = backfill(args.start_date, args.end_date, args.save_directory, args.store_directory,
+                       args.download_workers, args.parse_workers)
+    stored = [date_str for date_str, row_count in results.items() if row_count is not None]
+    print(f"Backfilled {len(stored)} of {len(results)} dates.")
@@ -0,0 +1,279 @@
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import zipfile
+from operator import itemgetter
+from atomic_file import replace_file
+from lrp_rate import PARTITION_KEY_FIELDS, find_lrp_rate_member, format_lrp_rate_columns
+from instrumentation import peak_rss_bytes, stage, start_run, write_run_report
+
+# Constants
+FIXTURE_ZIP_PATH = "var/2024_ADMLivestockLrp_Daily_20231214.zip"
+TEMPLATE_WORKBOOK_PATH = "LRP_Swine.xlsx"
+BENCHMARK_DIRECTORY = "var/benchmark/"
+BASELINE_PATH = "benchmark_baseline.json"
+DEFAULT_SCALES = (1, 10, 100)
+REGRESSION_THRESHOLD = 1.20
+# Cold import of main must stay under this, so probing and start-up stay fast
+IMPORT_TIME_BUDGET_SECONDS = 0.25
+
+# Benchmark stages, matched against run report stage names by prefix
+STAGE_PREFIXES = {
+    'parse': ('parse',),
+    'filter': ('sheet:',),
+    'premium': ('premium:',),
+    'excel': ('format', 'excel_'),
+}
+
+
+def synthetic_zip_path(scale):
+    """
+    Build the path of the synthetic ADM zip for a scale factor.
+
+    Args:
+        scale (int): Scale factor relative to the fixture.
+
+    Returns:
+        str: Path to the zip.
+    """
+    if scale == 1:
+        return FIXTURE_ZIP_PATH
+    return os.path.join(BENCHMARK_DIRECTORY, f"synthetic_x{scale}.zip")
+
+
+def build_synthetic_zip(scale):
+    """
+    Write a synthetic ADM zip that repeats every fixture row `scale` times.
+
+    Every copy keeps its state, type and endorsement length but gets its
+    coverage price nudged, so each (commodity, state, type) partition and
+    each sheet grows by the scale factor. Existing zips are reused.
+
+    Args:
+        scale (int): Scale factor relative to the fixture.
+
+    Returns:
+        str: Path to the synthetic zip.
+    """
+    zip_path = synthetic_zip_path(scale)
+    if os.path.exists(zip_path):
+        return zip_path
+    os.makedirs(BENCHMARK_DIRECTORY, exist_ok=True)
+    print(f"Building synthetic file at {scale}x scale: {zip_path}")
+
+    def write(temp_path):
+        with zipfile.ZipFile(FIXTURE_ZIP_PATH, 'r') as source_zip, \
+                zipfile.ZipFile(temp_path, 'w', compression=zipfile.ZIP_DEFLATED) as target_zip:
+            member = find_lrp_rate_member(source_zip)
+            with source_zip.open(member) as source_file, \
+                    target_zip.open(member, 'w', force_zip64=True) as target_file:
+                header = source_file.readline()
+                target_file.write(header)
+                price_position = header.decode().rstrip('\r\n').split('|').index('Coverage Price')
+                for line in source_file:
+                    fields = line.decode().rstrip('\r\n').split('|')
+                    coverage_price = float(fields[price_position])
+                    lines = []
+                    for copy_index in range(scale):
+                        fields[price_position] = f"{coverage_price + copy_index * 0.0001:.4f}"
+                        lines.append('|'.join(fields))
+                    target_file.write(('\r\n'.join(lines) + '\r\n').encode())
+
+    return replace_file(zip_path, write)
+
+
+def file_output_matrix(zip_path=FIXTURE_ZIP_PATH):
+    """
+    List an output for every (commodity, state, type) block in a file.
+
+    Configured types keep their sheet names, and other types of a configured
+    commodity get '<type>_Sheet'. Synthetic files repeat every fixture row, so
+    the fixture's outputs cover every scale.
+
+    Args:
+        zip_path (str): Path to the ADM daily zip.
+
+    Returns:
+        list: (commodity code, state code, type code, sheet name) tuples, like main.output_matrix.
+    """
+    from main import NEW_COMMODITY_DIRECTORY, sheet_name_for
+
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref, zip_ref.open(find_lrp_rate_member(zip_ref)) as member_file:
+        lines = io.TextIOWrapper(member_file, encoding='utf-8')
+        header = lines.readline().rstrip('\r\n').split('|')
+        get_partition_key = itemgetter(*[header.index(name) for name in PARTITION_KEY_FIELDS])
+        partition_keys = {get_partition_key(line.split('|')) for line in lines if line.strip()}
+    # Sheets are built with the commodity's subsidy schedule, so only configured commodities can be built
+    return [
+        (key, state_code, sub_key,
+         sheet_name_for(NEW_COMMODITY_DIRECTORY[key]['sub_sheets'].get(sub_key, f"{sub_key}_Sheet"), state_code))
+        for key, state_code, sub_key in sorted(partition_keys)
+        if key in NEW_COMMODITY_DIRECTORY
+    ]
+
+
+def run_scale(scale):
+    """
+    Run the parse, filter, premium and Excel stages on one dataset.
+
+    Runs in a fresh worker process so peak RSS covers this dataset only.
+    Every state and type in the file is parsed, filtered and priced; the
+    Excel stage writes the sheets the workbook holds. The LrpRate file is
+    extracted into a fresh directory, so every run times the extraction and
+    no extracted copy is left behind.
+
+    Args:
+        scale (int): Scale factor relative to the fixture.
+
+    Returns:
+        dict: Per-stage seconds, rows, throughput, RSS change and peak RSS.
+    """
+    from main import INCREMENTAL_UPDATE, build_commodity_dfs, output_matrix, regenerate_excel, save_to_excel
+
+    zip_path = synthetic_zip_path(scale)
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        input_bytes = zip_ref.getinfo(find_lrp_rate_member(zip_ref)).file_size
+    baseline_rss = peak_rss_bytes()
+
+    outputs = file_output_matrix()
+    workbook_sheets = {sheet_name for _, _, _, sheet_name in output_matrix()}
+
+    run_report = start_run(scale=scale, zip_path=zip_path, outputs=len(outputs))
+    os.makedirs(BENCHMARK_DIRECTORY, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=BENCHMARK_DIRECTORY) as cache_directory:
+        commodity_dfs = build_commodity_dfs(zip_path, outputs=outputs, cache_directory=cache_directory)
+    workbook_dfs = [(sheet_name, df) for sheet_name, df in commodity_dfs if sheet_name in workbook_sheets]
+    # The writers take the sheets formatted, as main.run hands them over
+    with stage('format', sheets=len(workbook_dfs)):
+        sheet_dfs = [(sheet_name, format_lrp_rate_columns(df)) for sheet_name, df in workbook_dfs]
+    with tempfile.TemporaryDirectory() as temp_directory:
+        workbook_path = os.path.join(temp_directory, os.path.basename(TEMPLATE_WORKBOOK_PATH))
+        shutil.copyfile(TEMPLATE_WORKBOOK_PATH, workbook_path)
+        if INCREMENTAL_UPDATE:
+            save_to_excel(sheet_dfs, workbook_path)
+        else:
+            regenerate_excel(sheet_dfs, workbook_path)
+    output_rows = sum(len(df) for _, df in commodity_dfs)
+    workbook_rows = sum(len(df) for _, df in workbook_dfs)
+
+    results = {'scale': scale, 'input_bytes': input_bytes, 'outputs': len(outputs), 'output_rows': output_rows,
+               'workbook_rows': workbook_rows, 'stages': {}}
+    for stage_name, prefixes in STAGE_PREFIXES.items():
+        records = [record for record in run_report['stages'] if record['name'].startswith(prefixes)]
+        seconds = sum(record['seconds'] for record in records)
+        peak = max((record['peak_rss_bytes'] or 0 for record in records), default=0)
+        rss_delta = sum(record['rss_delta_bytes'] or 0 for record in records)
+        rows = {'parse': input_bytes, 'excel': workbook_rows}.get(stage_name, output_rows)
+        results['stages'][stage_name] = {
+            'seconds': round(seconds, 6),
+            'throughput': round(rows / seconds, 1) if seconds else None,
+            'throughput_unit': 'bytes/s' if stage_name == 'parse' else 'rows/s',
+            'rss_delta_mb': round(rss_delta / 1e6, 1),
+            'peak_rss_mb': round((peak - (baseline_rss or 0)) / 1e6, 1),
+        }
+    write_run_report(os.path.join(BENCHMARK_DIRECTORY, "reports"))
+    return results
+
+
+def measure_import_seconds(module_name, repeats=3):
+    """
+    Measure the cumulative import time of a module in fresh interpreters.
+
+    Args:
+        module_name (str): Module to import.
+        repeats (int): Number of interpreters to start; the fastest import is kept.
+
+    Returns:
+        float: Import time in seconds.
+    """
+    timings = []
+    for _ in range(repeats):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module_name}'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True,
+        )
+        # Lines read "import time: self [us] | cumulative | imported package"
+        for line in result.stderr.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() == module_name:
+                timings.append(int(fields[1]) / 1e6)
+    return min(timings)
+
+
+def compare_to_baseline(all_results, baseline):
+    """
+    Print each stage's time next to the baseline and flag regressions.
+
+    Args:
+        all_results (list): Results from run_scale.
+        baseline (dict): Stored results keyed by scale, or None.
+
+    Returns:
+        list: (scale, stage) pairs slower than the baseline by more than REGRESSION_THRESHOLD.
+    """
+    regressions = []
+    print(f"{'scale':>6} {'stage':<8} {'seconds':>10} {'baseline':>10} {'ratio':>7} {'throughput':>16} "
+          f"{'delta MB':>9} {'peak MB':>8}")
+    for results in all_results:
+        baseline_stages = (baseline or {}).get(str(results['scale']), {}).get('stages', {})
+        for stage_name, stage_results in results['stages'].items():
+            baseline_seconds = baseline_stages.get(stage_name, {}).get('seconds')
+            ratio = stage_results['seconds'] / baseline_seconds if baseline_seconds else None
+            if ratio is not None and ratio > REGRESSION_THRESHOLD:
+                regressions.append((results['scale'], stage_name))
+            throughput = f"{stage_results['throughput'] or 0:,.0f} {stage_results['throughput_unit']}"
+            print(f"{results['scale']:>5}x {stage_name:<8} {stage_results['seconds']:>10.3f} "
+                  f"{baseline_seconds if baseline_seconds is not None else '-':>10} "
+                  f"{f'{ratio:.2f}' if ratio is not None else '-':>7} {throughput:>16} "
+                  f"{stage_results.get('rss_delta_mb', '-'):>9} {stage_results['peak_rss_mb']:>8}")
+    return regressions
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description="Benchmark the LRP pipeline stages on recorded and synthetic files.")
+    parser.add_argument("--scales", type=int, nargs="+", default=list(DEFAULT_SCALES),
+                        help="Scale factors relative to the recorded fixture")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--import-budget", type=float, default=IMPORT_TIME_BUDGET_SECONDS,
+                        help="Maximum cold import time of main in seconds")
+    parser.add_argument("--import-only", action="store_true", help="Only check the import time of main")
+    args = parser.parse_args()
+
+    import_seconds = measure_import_seconds('main')
+    print(f"Import time of main: {import_seconds:.3f}s (budget {args.import_budget:.3f}s)")
+    over_import_budget = import_seconds > args.import_budget
+    if over_import_budget:
+        print("Regression: importing main is over budget; keep heavy imports inside the functions that use them")
+    if args.import_only:
+        sys.exit(1 if over_import_budget else 0)
+
+    all_results = []
+    for scale in args.scales:
+        build_synthetic_zip(scale)
+        # A fresh process per dataset keeps peak memory from leaking between scales
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            all_results.append(pool.apply(run_scale, (scale,)))
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+    else:
+        print(f"No baseline found at '{args.baseline}'")
+    regressions = compare_to_baseline(all_results, baseline)
+    for scale, stage_name in regressions:
+        print(f"Regression: {stage_name} at {scale}x is more than {REGRESSION_THRESHOLD:.0%} of baseline")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump({str(results['scale']): results for results in all_results}, baseline_file, indent=2)
+        print(f"Baseline saved to '{args.baseline}'")
+    sys.exit(1 if regressions or over_import_budget else 0)
@@ -0,0 +1,188 @@
+import re
+
+try:
+    import tomllib
+except ImportError:
+    # Python before 3.11 needs the tomli package for the same parser
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+# Codes as they appear in the ADM LrpRate file
+COMMODITY_CODE_PATTERN = re.compile(r'^\d{4}$')
+TYPE_CODE_PATTERN = re.compile(r'^\d{3}$')
+STATE_CODE_PATTERN = re.compile(r'^\d{2}$')
+# Excel sheet names are at most 31 characters and cannot contain []:*?/\
+SHEET_NAME_PATTERN = re.compile(r'^[^\[\]:*?/\\]{1,31}$')
+DEFAULT_SUBSIDY_SCHEDULE = 'default'
+
+
+def expect_type(value, expected_type, description, source):
+    """
+    Check the type of a registry entry before it is used.
+
+    Args:
+        value: Entry to check.
+        expected_type (type): dict for a TOML table, list for an array, str or bool.
+        description (str): What the entry is, for the error message.
+        source (str): Where the registry came from, for error messages.
+
+    Returns:
+        The entry.
+    """
+    names = {dict: 'a table', list: 'an array', str: 'a string', bool: 'true or false'}
+    if not isinstance(value, expected_type):
+        raise ValueError(f"{source}: {description} must be {names[expected_type]}, got {value!r}")
+    return value
+
+
+def compile_subsidy_schedule(name, bands, source):
+    """
+    Check a subsidy schedule and turn it into the band tuples premium.py uses.
+
+    Args:
+        name (str): Schedule name.
+        bands (list): [lowest coverage level, subsidy rate] pairs.
+        source (str): Where the registry came from, for error messages.
+
+    Returns:
+        tuple: (lowest coverage level, subsidy rate) bands in ascending order.
+    """
+    if not isinstance(bands, list) or not bands:
+        raise ValueError(f"{source}: subsidy schedule '{name}' must be a list of [coverage level, rate] bands")
+    compiled = []
+    for band in bands:
+        if not (isinstance(band, list) and len(band) == 2 and all(isinstance(value, (int, float)) for value in band)):
+            raise ValueError(f"{source}: subsidy schedule '{name}' has a malformed band {band!r}")
+        lower_bound, rate = float(band[0]), float(band[1])
+        if not (0 < lower_bound <= 1 and 0 <= rate <= 1):
+            raise ValueError(f"{source}: subsidy schedule '{name}' band {band!r} is outside 0-1")
+        compiled.append((lower_bound, rate))
+    if any(lower >= upper for (lower, _), (upper, _) in zip(compiled, compiled[1:])):
+        raise ValueError(f"{source}: subsidy schedule '{name}' bands must be in ascending coverage level order")
+    return tuple(compiled)
+
+
+def check_written_sheet_names(commodities, state_codes, target_state_code, source='registry'):
+    """
+    Check the sheet names that will be written for a set of states.
+
+    Sheets of states other than the target get the state code appended (see
+    main.sheet_name_for), so a name can outgrow Excel's 31 characters or
+    clash with another sheet once the states are known.
+
+    Args:
+        commodities (dict): Compiled commodities.
+        state_codes (list): States sheets are built for.
+        target_state_code (str): State whose sheets keep their plain names.
+        source (str): Where the registry or states came from, for error messages.
+    """
+    written_sheets = {}
+    for commodity_code, commodity in commodities.items():
+        for sheet_name in commodity['sub_sheets'].values():
+            for state_code in state_codes:
+                written_name = sheet_name if state_code == target_state_code else f"{sheet_name}_{state_code}"
+                if not SHEET_NAME_PATTERN.match(written_name):
+                    raise ValueError(f"{source}: sheet '{written_name}' for state {state_code} is not a valid "
+                                     f"Excel sheet name")
+                if written_name in written_sheets:
+                    raise ValueError(f"{source}: sheet '{written_name}' would be written for both "
+                                     f"{written_sheets[written_name]} and {commodity_code}/{state_code}")
+                written_sheets[written_name] = f"{commodity_code}/{state_code}"
+
+
+def compile_registry(config, source='registry'):
+    """
+    Check a parsed registry and compile it into the lookup structures the pipeline uses.
+
+    Disabled commodities are checked but left out of the result. Sheet names
+    are checked as they will be written, including the '<sheet>_<state>'
+    names of states other than the target.
+
+    Args:
+        config (dict): Parsed registry.
+        source (str): Where the registry came from, for error messages.
+
+    Returns:
+        dict: 'target_state_code', 'state_codes', and 'commodities' keyed by commodity code,
+            each with 'name', 'directory_name', 'sub_sheets' (type code to sheet name) and 'subsidy_bands'.
+    """
+    states = expect_type(config.get('states', {}), dict, "[states]", source)
+    target_state_code = states.get('target')
+    state_codes = expect_type(states.get('build', [target_state_code]), list, "states.build", source)
+    for state_code in [target_state_code, *state_codes]:
+        if not isinstance(state_code, str) or not STATE_CODE_PATTERN.match(state_code):
+            raise ValueError(f"{source}: state codes must be two-digit strings, got {state_code!r}")
+    if len(set(state_codes)) != len(state_codes):
+        raise ValueError(f"{source}: states.build lists a state more than once")
+
+    schedules = {
+        name: compile_subsidy_schedule(name, bands, source)
+        for name, bands in expect_type(config.get('subsidy_schedules', {}), dict, "[subsidy_schedules]",
+                                       source).items()
+    }
+
+    commodities = {}
+    sheet_owners = {}
+    for commodity_code, definition in expect_type(config.get('commodities', {}), dict, "[commodities]",
+                                                  source).items():
+        if not COMMODITY_CODE_PATTERN.match(commodity_code):
+            raise ValueError(f"{source}: commodity code '{commodity_code}' must be four digits")
+        expect_type(definition, dict, f"commodity '{commodity_code}'", source)
+        directory_name = definition.get('directory_name')
+        if not isinstance(directory_name, str) or not directory_name:
+            raise ValueError(f"{source}: commodity '{commodity_code}' needs a directory_name")
+        expect_type(definition.get('name', commodity_code), str, f"commodity '{commodity_code}' name", source)
+        enabled = expect_type(definition.get('enabled', True), bool, f"commodity '{commodity_code}' enabled", source)
+        schedule_name = definition.get('subsidy_schedule', DEFAULT_SUBSIDY_SCHEDULE)
+        if not isinstance(schedule_name, str) or schedule_name not in schedules:
+            raise ValueError(f"{source}: commodity '{commodity_code}' uses unknown subsidy schedule {schedule_name!r}")
+
+        sub_sheets = expect_type(definition.get('sub_sheets', {}), dict, f"commodity '{commodity_code}' sub_sheets",
+                                 source)
+        for type_code, sheet_name in sub_sheets.items():
+            if not TYPE_CODE_PATTERN.match(type_code):
+                raise ValueError(f"{source}: commodity '{commodity_code}' type code '{type_code}' must be three digits")
+            if not isinstance(sheet_name, str) or not SHEET_NAME_PATTERN.match(sheet_name):
+                raise ValueError(f"{source}: '{sheet_name}' is not a valid Excel sheet name")
+            if sheet_name in sheet_owners:
+                raise ValueError(f"{source}: sheet '{sheet_name}' is used by both commodity "
+                                 f"'{sheet_owners[sheet_name]}' and '{commodity_code}'")
+            sheet_owners[sheet_name] = commodity_code
+
+        if not enabled:
+            continue
+        if not sub_sheets:
+            raise ValueError(f"{source}: enabled commodity '{commodity_code}' has no sub_sheets")
+        commodities[commodity_code] = {
+            'name': definition.get('name', commodity_code),
+            'directory_name': directory_name,
+            'sub_sheets': dict(sub_sheets),
+            'subsidy_bands': schedules[schedule_name],
+        }
+
+    if not commodities:
+        raise ValueError(f"{source}: no enabled commodities")
+    check_written_sheet_names(commodities, state_codes, target_state_code, source)
+    return {'target_state_code': target_state_code, 'state_codes': list(state_codes), 'commodities': commodities}
+
+
+def load_registry(path):
+    """
+    Read, check and compile the commodity registry.
+
+    Args:
+        path (str): Path to the TOML registry.
+
+    Returns:
+        dict: Compiled registry, see compile_registry.
+    """
+    if tomllib is None:
+        raise Exception("Reading the commodity registry needs Python 3.11 or the tomli package.")
+    with open(path, 'rb') as registry_file:
+        try:
+            config = tomllib.load(registry_file)
+        except tomllib.TOMLDecodeError as e:
+            raise ValueError(f"{path}: {e}")
+    return compile_registry(config, path)
@@ -0,0 +1,433 @@
+import asyncio
+import email.utils
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+import zipfile
+import zlib
+from atomic_file import replace_file
+from http_pool import ConnectionPool
+
+# Cache index kept next to the downloaded files
+CACHE_INDEX_FILENAME = "download_cache.json"
+CHUNK_SIZE = 1024 * 1024
+# Sidecar holding the ETag/Last-Modified a partial download can be resumed against
+PARTIAL_VALIDATOR_SUFFIX = ".validator"
+
+# Serializes cache index updates from concurrent downloads
+_cache_index_lock = threading.Lock()
+
+# Publication watcher polling settings (seconds)
+POLL_INITIAL_INTERVAL = 5
+POLL_MAX_INTERVAL = 60
+POLL_BACKOFF_FACTOR = 1.5
+POLL_JITTER = 0.2
+
+
+def backoff_delays(initial=POLL_INITIAL_INTERVAL, maximum=POLL_MAX_INTERVAL,
+                   factor=POLL_BACKOFF_FACTOR, jitter=POLL_JITTER):
+    """
+    Yield exponentially growing delays with random jitter, capped at a maximum.
+
+    Args:
+        initial (float): First delay in seconds.
+        maximum (float): Largest delay in seconds before jitter.
+        factor (float): Growth factor between delays.
+        jitter (float): Fraction each delay is randomly stretched or shrunk by.
+
+    Yields:
+        float: Next delay in seconds.
+    """
+    delay = initial
+    while True:
+        yield delay * random.uniform(1 - jitter, 1 + jitter)
+        delay = min(maximum, delay * factor)
+
+
+def is_url_published(url, timeout=30):
+    """
+    Check whether a URL exists with a HEAD request, without downloading the body.
+
+    Network errors are raised rather than answered with False, so a caller
+    can tell an unpublished file from an unreachable server.
+
+    Args:
+        url (str): URL to check.
+        timeout (int): Socket timeout in seconds.
+
+    Returns:
+        bool: True if the server answers 200, False if it answers with an HTTP error such as 404.
+    """
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, method='HEAD'), timeout=timeout) as response:
+            return response.status == 200
+    except urllib.error.HTTPError:
+        return False
+
+
+def is_listed(listing_url, filename, validators, timeout=30):
+    """
+    Check a directory listing for a file name with a conditional GET.
+
+    The listing's ETag/Last-Modified are kept in validators, so an unchanged
+    listing answers 304 and is treated as still not containing the file.
+
+    Args:
+        listing_url (str): URL of the directory listing.
+        filename (str): File name to look for.
+        validators (dict): Validators from the previous poll, updated in place.
+        timeout (int): Socket timeout in seconds.
+
+    Returns:
+        bool: True if the file name appears in the listing.
+    """
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    try:
+        with urllib.request.urlopen(urllib.request.Request(listing_url, headers=headers), timeout=timeout) as response:
+            body = response.read()
+            validators['etag'] = response.headers.get('ETag')
+            validators['last_modified'] = response.headers.get('Last-Modified')
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return False
+        raise
+    return filename.encode() in body
+
+
+def wait_for_publication(url, deadline_seconds, timeout=30):
+    """
+    Poll the RMA directory listing until a file is published or a deadline passes.
+
+    Polls start a few seconds apart and back off with jitter, so a file is
+    picked up shortly after release without hammering the server. If the
+    listing itself cannot be read, the file URL is checked with HEAD instead.
+
+    Args:
+        url (str): URL of the file to wait for.
+        deadline_seconds (float): Total time to wait before giving up.
+        timeout (int): Socket timeout in seconds.
+
+    Returns:
+        bool: True once the file is published, False if the deadline passed first.
+    """
+    listing_url = url.rsplit('/', 1)[0] + '/'
+    filename = os.path.basename(url)
+    validators = {}
+    deadline = time.monotonic() + deadline_seconds
+    delays = backoff_delays()
+    while True:
+        try:
+            published = is_listed(listing_url, filename, validators, timeout)
+        except (urllib.error.URLError, OSError):
+            try:
+                published = is_url_published(url, timeout)
+            except (urllib.error.URLError, OSError) as e:
+                # Keep polling through network outages until the deadline
+                print(f"Could not reach the RMA server: {e}")
+                published = False
+        if published:
+            return True
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        delay = min(next(delays), remaining)
+        print(f"File '{filename}' not published yet, checking again in {delay:.0f}s")
+        time.sleep(delay)
+
+
+def load_cache_index(save_directory):
+    """
+    Load the download cache index for a directory.
+
+    Args:
+        save_directory (str): Directory holding the downloaded files.
+
+    Returns:
+        dict: Cache entries keyed by URL.
+    """
+    index_path = os.path.join(save_directory, CACHE_INDEX_FILENAME)
+    if not os.path.exists(index_path):
+        return {}
+    try:
+        with open(index_path, 'r') as index_file:
+            return json.load(index_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache_index(save_directory, cache_index):
+    """
+    Write the download cache index for a directory.
+
+    Args:
+        save_directory (str): Directory holding the downloaded files.
+        cache_index (dict): Cache entries keyed by URL.
+    """
+    def write(temp_path):
+        with open(temp_path, 'w') as index_file:
+            json.dump(cache_index, index_file, indent=2, sort_keys=True)
+
+    replace_file(os.path.join(save_directory, CACHE_INDEX_FILENAME), write)
+
+
+def update_cache_entry(save_directory, url, entry):
+    """
+    Record one URL's cache entry, safe to call from several download threads.
+
+    Args:
+        save_directory (str): Directory holding the downloaded files.
+        url (str): URL the entry belongs to.
+        entry (dict): Cache entry to store.
+    """
+    with _cache_index_lock:
+        cache_index = load_cache_index(save_directory)
+        cache_index[url] = entry
+        save_cache_index(save_directory, cache_index)
+
+
+def file_crc32(filepath):
+    """
+    Calculate the CRC-32 of a file.
+
+    Args:
+        filepath (str): Path to the file.
+
+    Returns:
+        int: CRC-32 checksum.
+    """
+    crc = 0
+    with open(filepath, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def is_zip_intact(filepath):
+    """
+    Check that a zip opens and every member matches its stored CRC.
+
+    Args:
+        filepath (str): Path to the zip file.
+
+    Returns:
+        bool: True if the zip is complete and uncorrupted.
+    """
+    try:
+        with zipfile.ZipFile(filepath, 'r') as zip_ref:
+            return zip_ref.testzip() is None
+    except (OSError, zipfile.BadZipFile):
+        return False
+
+
+def is_cached_copy_current(filepath, entry):
+    """
+    Check a local copy against the size and CRC recorded when it was stored.
+
+    Args:
+        filepath (str): Path to the local copy.
+        entry (dict): Cache entry for the URL, or None.
+
+    Returns:
+        bool: True if the local copy is the one recorded in the cache.
+    """
+    if not entry or not os.path.exists(filepath):
+        return False
+    return os.path.getsize(filepath) == entry.get('size') and file_crc32(filepath) == entry.get('crc32')
+
+
+def parse_content_range(content_range):
+    """
+    Parse a Content-Range header such as 'bytes 100-999/1000'.
+
+    Args:
+        content_range (str): Header value.
+
+    Returns:
+        tuple: First byte position and total size, each None if missing.
+    """
+    match = re.fullmatch(r'bytes (\d+)-\d+/(\d+|\*)', content_range.strip())
+    if match is None:
+        return None, None
+    return int(match.group(1)), int(match.group(2)) if match.group(2) != '*' else None
+
+
+def load_partial_validator(partial_path):
+    """
+    Load the ETag or Last-Modified of the file a partial download belongs to.
+
+    Args:
+        partial_path (str): Path of the partial download.
+
+    Returns:
+        str: The validator, or None if there is none.
+    """
+    try:
+        with open(partial_path + PARTIAL_VALIDATOR_SUFFIX, 'r') as validator_file:
+            return validator_file.read().strip() or None
+    except OSError:
+        return None
+
+
+def save_partial_validator(partial_path, validator):
+    """
+    Record the ETag or Last-Modified of the file a partial download belongs to.
+
+    Args:
+        partial_path (str): Path of the partial download.
+        validator (str): The validator, or None if the server sent none.
+    """
+    if validator:
+        with open(partial_path + PARTIAL_VALIDATOR_SUFFIX, 'w') as validator_file:
+            validator_file.write(validator)
+    elif os.path.exists(partial_path + PARTIAL_VALIDATOR_SUFFIX):
+        os.remove(partial_path + PARTIAL_VALIDATOR_SUFFIX)
+
+
+def remove_partial(partial_path):
+    """
+    Remove a partial download and its validator.
+
+    Args:
+        partial_path (str): Path of the partial download.
+    """
+    for path in (partial_path, partial_path + PARTIAL_VALIDATOR_SUFFIX):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+async def fetch_cached_async(pool, url, save_directory, progress=None):
+    """
+    Download a file into a directory over a pooled connection unless the local copy is still current.
+
+    A conditional GET is sent with the ETag/Last-Modified validators of the
+    cached copy, so an unchanged file answers 304 and no body is transferred.
+    New downloads are streamed to a partial file, checked against the
+    expected size and the zip CRCs, and only then moved into place. If an
+    earlier download of the same file was cut off, it is resumed with a Range
+    request; the server sends the whole file instead if it has changed since.
+
+    Args:
+        pool (http_pool.ConnectionPool): Connection pool to send the request on.
+        url (str): URL to download the file from.
+        save_directory (str): Directory to save the downloaded file.
+        progress (callable): Called as progress(url, bytes_done, bytes_total) after each chunk;
+            bytes_total is None when the server does not say.
+
+    Returns:
+        tuple: Local file path and True if bytes were downloaded, False if the cached copy was used.
+    """
+    os.makedirs(save_directory, exist_ok=True)
+    filename = os.path.basename(url)
+    filepath = os.path.join(save_directory, filename)
+    partial_path = filepath + '.part'
+    entry = load_cache_index(save_directory).get(url)
+
+    # Build the validators for a conditional GET
+    headers = {}
+    if is_cached_copy_current(filepath, entry):
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+    elif entry is None and os.path.exists(filepath) and is_zip_intact(filepath):
+        # A copy from before the cache existed: fall back to its modification time
+        headers['If-Modified-Since'] = email.utils.formatdate(os.path.getmtime(filepath), usegmt=True)
+
+    # Resume a cut-off download, as long as the file is still the one it started on
+    resume_from = 0
+    partial_validator = load_partial_validator(partial_path)
+    if not headers and partial_validator and os.path.exists(partial_path):
+        resume_from = os.path.getsize(partial_path)
+        if resume_from:
+            headers['Range'] = f"bytes={resume_from}-"
+            headers['If-Range'] = partial_validator
+
+    response = await pool.request('GET', url, headers)
+    if response.status == 304:
+        if entry is None:
+            update_cache_entry(save_directory, url, {
+                'filename': filename, 'etag': None, 'last_modified': headers['If-Modified-Since'],
+                'size': os.path.getsize(filepath), 'crc32': file_crc32(filepath),
+            })
+        return filepath, False
+    if response.status == 416 and resume_from:
+        # The partial file is no use; start over, reading the short error body so the connection can be reused
+        await response.read()
+        remove_partial(partial_path)
+        return await fetch_cached_async(pool, url, save_directory, progress)
+    if response.status not in (200, 206):
+        await response.read()
+        raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+
+    etag = response.headers.get('etag')
+    last_modified = response.headers.get('last-modified')
+    content_length = response.headers.get('content-length')
+    if response.status == 206:
+        range_start, expected_size = parse_content_range(response.headers.get('content-range', ''))
+        if range_start != resume_from:
+            response.release()
+            remove_partial(partial_path)
+            raise Exception(f"Server resumed '{filename}' at byte {range_start} instead of {resume_from}.")
+        crc = file_crc32(partial_path)
+        size = resume_from
+        mode = 'ab'
+        print(f"Resuming '{filename}' at byte {resume_from}")
+    else:
+        expected_size = int(content_length) if content_length is not None else None
+        crc = 0
+        size = 0
+        mode = 'wb'
+    save_partial_validator(partial_path, etag or last_modified)
+
+    # Stream the body to the partial file while checksumming it
+    with open(partial_path, mode) as partial_file:
+        async for chunk in response.iter_chunks():
+            partial_file.write(chunk)
+            size += len(chunk)
+            crc = zlib.crc32(chunk, crc)
+            if progress is not None:
+                progress(url, size, expected_size)
+
+    if expected_size is not None and expected_size != size:
+        remove_partial(partial_path)
+        raise Exception(f"Incomplete download of '{filename}': {size} of {expected_size} bytes.")
+    if filename.endswith('.zip') and not is_zip_intact(partial_path):
+        remove_partial(partial_path)
+        raise Exception(f"Downloaded file '{filename}' failed the zip CRC check.")
+    os.replace(partial_path, filepath)
+    remove_partial(partial_path)
+
+    update_cache_entry(save_directory, url, {
+        'filename': filename, 'etag': etag, 'last_modified': last_modified, 'size': size, 'crc32': crc,
+    })
+    return filepath, True
+
+
+def fetch_cached(url, save_directory, timeout=60):
+    """
+    Download a single file unless the local copy is still current.
+
+    Runs fetch_cached_async on its own event loop and connection.
+
+    Args:
+        url (str): URL to download the file from.
+        save_directory (str): Directory to save the downloaded file.
+        timeout (int): Socket timeout in seconds.
+
+    Returns:
+        tuple: Local file path and True if bytes were downloaded, False if the cached copy was used.
+    """
+    async def fetch():
+        async with ConnectionPool(timeout=timeout) as pool:
+            return await fetch_cached_async(pool, url, save_directory)
+    return asyncio.run(fetch())
@@ -0,0 +1,477 @@
+import difflib
+import math
+import numbers
+import os
+import posixpath
+import re
+import shutil
+import zipfile
+from copy import copy
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+import numpy as np
+import pandas as pd
+from atomic_file import replace_file
+
+# Number of header rows kept at the top of every data sheet
+HEADER_ROWS = 1
+# Relative tolerance for treating floats as unchanged; Excel keeps about 15 significant digits
+FLOAT_RELATIVE_TOLERANCE = 1e-12
+
+# Workbook parts read when regenerating a workbook from its template
+WORKBOOK_PART = 'xl/workbook.xml'
+WORKBOOK_RELS_PART = 'xl/_rels/workbook.xml.rels'
+CONTENT_TYPES_PART = '[Content_Types].xml'
+# Excel rebuilds the calculation chain on load; a stale one makes it repair the file
+CALC_CHAIN_PART = 'xl/calcChain.xml'
+SPREADSHEET_NAMESPACE = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+RELATIONSHIP_ID = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+TEMPLATE_CHUNK_SIZE = 64 * 1024
+# Data rows written to a sheet part per write call
+ROW_BATCH_SIZE = 1000
+
+
+def replace_sheet_rows(wb, sheet_name, df):
+    """
+    Replace the data rows of a sheet with a DataFrame, written as whole rows.
+
+    A fresh sheet is built in place of the old one so nothing has to be shifted
+    or cleared cell by cell. The header rows, column widths and the sheet's
+    position in the workbook are carried over; other sheets are untouched.
+
+    Args:
+        wb (openpyxl.Workbook): Open workbook.
+        sheet_name (str): Name of the sheet to replace.
+        df (pandas.DataFrame): Data written below the header rows.
+
+    Returns:
+        openpyxl.worksheet.worksheet.Worksheet: The replacement sheet.
+    """
+    if sheet_name not in wb.sheetnames:
+        sheet = wb.create_sheet(title=sheet_name)
+        sheet.append([None] * len(df.columns))
+        for row in df.itertuples(index=False, name=None):
+            sheet.append(row)
+        return sheet
+
+    old_sheet = wb[sheet_name]
+    sheet = wb.create_sheet(title=f"{sheet_name}_new", index=wb.index(old_sheet))
+
+    # Carry over the header rows and sheet layout
+    for header_row in old_sheet.iter_rows(min_row=1, max_row=HEADER_ROWS):
+        for old_cell in header_row:
+            cell = sheet.cell(row=old_cell.row, column=old_cell.column, value=old_cell.value)
+            if old_cell.has_style:
+                cell._style = copy(old_cell._style)
+    for column_letter, dimension in old_sheet.column_dimensions.items():
+        sheet.column_dimensions[column_letter].width = dimension.width
+    sheet.freeze_panes = old_sheet.freeze_panes
+
+    # Write the data as whole rows below the header
+    for row in df.itertuples(index=False, name=None):
+        sheet.append(row)
+
+    wb.remove(old_sheet)
+    sheet.title = sheet_name
+    return sheet
+
+
+def read_sheet_rows(sheet, column_count):
+    """
+    Read the data rows below the header of a sheet.
+
+    Args:
+        sheet (openpyxl.worksheet.worksheet.Worksheet): Sheet to read.
+        column_count (int): Minimum number of columns to read per row.
+
+    Returns:
+        list: Row value tuples, with trailing empty rows removed.
+    """
+    rows = list(sheet.iter_rows(min_row=HEADER_ROWS + 1, max_col=max(sheet.max_column, column_count),
+                                values_only=True))
+    while rows and all(value is None for value in rows[-1]):
+        rows.pop()
+    return rows
+
+
+def values_differ(value, previous_value):
+    """
+    Compare a new cell value with the one in the sheet, ignoring float round-off.
+
+    Args:
+        value: New value.
+        previous_value: Value currently in the sheet.
+
+    Returns:
+        bool: True if the cell needs to be written.
+    """
+    if isinstance(value, numbers.Real) and isinstance(previous_value, numbers.Real):
+        if math.isnan(value) or math.isnan(previous_value):
+            return math.isnan(value) != math.isnan(previous_value)
+        return not math.isclose(value, previous_value, rel_tol=FLOAT_RELATIVE_TOLERANCE)
+    return value != previous_value
+
+
+def diff_rows(previous_df, df, key_columns):
+    """
+    Compare two versions of a sheet's rows by key.
+
+    Args:
+        previous_df (pandas.DataFrame): Rows from the previous run.
+        df (pandas.DataFrame): Rows from this run.
+        key_columns (list): Columns identifying a row.
+
+    Returns:
+        dict: Counts of inserted, updated and deleted rows.
+    """
+    previous = previous_df.drop_duplicates(subset=key_columns, keep='last').set_index(key_columns)
+    current = df.drop_duplicates(subset=key_columns, keep='last').set_index(key_columns)
+    common = current.index.intersection(previous.index)
+    changed = np.zeros(len(common), dtype=bool)
+    for column in current.columns:
+        new_values = current.loc[common, column]
+        old_values = previous.loc[common, column]
+        if pd.api.types.is_numeric_dtype(new_values):
+            changed |= ~np.isclose(new_values.to_numpy(dtype=float),
+                                   pd.to_numeric(old_values, errors='coerce').to_numpy(dtype=float),
+                                   rtol=FLOAT_RELATIVE_TOLERANCE, atol=0.0, equal_nan=True)
+        else:
+            changed |= (new_values != old_values).to_numpy()
+    return {
+        'inserted': len(current.index.difference(previous.index)),
+        'updated': int(changed.sum()),
+        'deleted': len(previous.index.difference(current.index)),
+    }
+
+
+def write_changed_cells(sheet, row_idx, values, previous):
+    """
+    Write the cells of one row whose value differs from what the sheet holds.
+
+    Args:
+        sheet (openpyxl.worksheet.worksheet.Worksheet): Sheet to write to.
+        row_idx (int): Row number to write.
+        values (tuple): New row values.
+        previous (tuple): Row values currently in the sheet.
+
+    Returns:
+        int: Number of cells written.
+    """
+    cells_written = 0
+    for col_idx in range(1, max(len(values), len(previous)) + 1):
+        value = values[col_idx - 1] if col_idx <= len(values) else None
+        previous_value = previous[col_idx - 1] if col_idx <= len(previous) else None
+        if values_differ(value, previous_value):
+            sheet.cell(row=row_idx, column=col_idx, value=value)
+            cells_written += 1
+    return cells_written
+
+
+def update_sheet_rows(wb, sheet_name, df, key_columns):
+    """
+    Bring a sheet's data rows up to date by applying only the rows that changed.
+
+    The rows already in the sheet are taken as the previous run and matched
+    to the DataFrame by key. Deleted keys have their rows removed, inserted
+    keys get new rows at their sorted position, and matched rows only have
+    their changed cells written. Edits are applied bottom-up so earlier row
+    numbers stay valid.
+
+    Args:
+        wb (openpyxl.Workbook): Open workbook.
+        sheet_name (str): Name of the sheet to update.
+        df (pandas.DataFrame): Data for the rows below the header.
+        key_columns (list): Columns identifying a row.
+
+    Returns:
+        dict: Counts of inserted, updated and deleted rows and of cells written.
+    """
+    if sheet_name not in wb.sheetnames:
+        replace_sheet_rows(wb, sheet_name, df)
+        return {'inserted': len(df), 'updated': 0, 'deleted': 0, 'cells_written': df.size}
+
+    sheet = wb[sheet_name]
+    previous_rows = read_sheet_rows(sheet, len(df.columns))
+    previous_df = pd.DataFrame([row[:len(df.columns)] for row in previous_rows], columns=df.columns)
+    diff = diff_rows(previous_df, df, key_columns)
+
+    # Line up previous and new rows by key
+    key_positions = [df.columns.get_loc(column) for column in key_columns]
+    new_rows = list(df.itertuples(index=False, name=None))
+    previous_keys = [tuple(row[pos] for pos in key_positions) for row in previous_rows]
+    new_keys = [tuple(row[pos] for pos in key_positions) for row in new_rows]
+    matcher = difflib.SequenceMatcher(None, previous_keys, new_keys, autojunk=False)
+
+    cells_written = 0
+    for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+        first_row = HEADER_ROWS + 1 + i1
+        overlap = min(i2 - i1, j2 - j1)
+        for offset in range(overlap):
+            cells_written += write_changed_cells(sheet, first_row + offset, new_rows[j1 + offset],
+                                                 previous_rows[i1 + offset])
+        if i2 - i1 > overlap:
+            sheet.delete_rows(first_row + overlap, i2 - i1 - overlap)
+        elif j2 - j1 > overlap:
+            sheet.insert_rows(first_row + overlap, j2 - j1 - overlap)
+            for offset in range(overlap, j2 - j1):
+                cells_written += write_changed_cells(sheet, first_row + offset, new_rows[j1 + offset], ())
+
+    diff['cells_written'] = cells_written
+    return diff
+
+
+def template_sheet_parts(template_path):
+    """
+    Map the sheet names of a workbook to the zip parts holding them.
+
+    Args:
+        template_path (str): Path to the template workbook.
+
+    Returns:
+        dict: Sheet name to part name, e.g. {'809_Sheet': 'xl/worksheets/sheet19.xml'}.
+    """
+    with zipfile.ZipFile(template_path, 'r') as zip_ref:
+        workbook = ElementTree.fromstring(zip_ref.read(WORKBOOK_PART))
+        rels = ElementTree.fromstring(zip_ref.read(WORKBOOK_RELS_PART))
+    targets = {rel.get('Id'): rel.get('Target') for rel in rels}
+    parts = {}
+    for sheet in workbook.iter(f"{SPREADSHEET_NAMESPACE}sheet"):
+        target = targets[sheet.get(RELATIONSHIP_ID)]
+        # Targets are either absolute within the package or relative to xl/
+        parts[sheet.get('name')] = target.lstrip('/') if target.startswith('/') else posixpath.normpath(
+            posixpath.join('xl', target))
+    return parts
+
+
+def split_sheet_template(source, header_rows=HEADER_ROWS):
+    """
+    Split a template sheet's XML around its data rows, reading it in chunks.
+
+    Only the header rows and the markup around the sheet data are kept, so
+    the memory used does not depend on how many data rows the template has.
+
+    Args:
+        source: Binary file object of the sheet part.
+        header_rows (int): Number of rows kept from the top of the sheet.
+
+    Returns:
+        tuple: The XML up to and including the header rows, and the XML from the end of the sheet data.
+    """
+    buffer = b''
+
+    def fill():
+        nonlocal buffer
+        chunk = source.read(TEMPLATE_CHUNK_SIZE)
+        buffer += chunk
+        return bool(chunk)
+
+    while b'<sheetData' not in buffer:
+        if not fill():
+            raise ValueError("Template sheet has no sheet data")
+    start = buffer.index(b'<sheetData')
+    while buffer.find(b'>', start) == -1:
+        if not fill():
+            raise ValueError("Template sheet data tag is not closed")
+    tag_end = buffer.index(b'>', start) + 1
+    # The stored dimension describes the old data; Excel works it out again
+    head = [re.sub(rb'<dimension [^>]*/>', b'', buffer[:start])]
+    if buffer[tag_end - 2:tag_end] == b'/>':
+        head.append(b'<sheetData>')
+        buffer = b'</sheetData>' + buffer[tag_end:]
+    else:
+        head.append(buffer[start:tag_end])
+        buffer = buffer[tag_end:]
+
+    row_number = 0
+    while True:
+        row_start = buffer.find(b'<row')
+        data_end = buffer.find(b'</sheetData>')
+        if data_end != -1 and (row_start == -1 or data_end < row_start):
+            break
+        if row_start == -1:
+            # Keep a possible partial tag at the end of the buffer
+            buffer = buffer[-len(b'</sheetData>'):]
+            if not fill():
+                raise ValueError("Template sheet data is not closed")
+            continue
+        while buffer.find(b'>', row_start) == -1:
+            if not fill():
+                raise ValueError("Template sheet row tag is not closed")
+        open_end = buffer.index(b'>', row_start) + 1
+        if buffer[open_end - 2:open_end] == b'/>':
+            row_end = open_end
+        else:
+            while buffer.find(b'</row>', open_end) == -1:
+                if not fill():
+                    raise ValueError("Template sheet row is not closed")
+            row_end = buffer.index(b'</row>', open_end) + len(b'</row>')
+        match = re.search(rb'\br="(\d+)"', buffer[row_start:open_end])
+        row_number = int(match.group(1)) if match else row_number + 1
+        if row_number <= header_rows:
+            head.append(buffer[row_start:row_end])
+        buffer = buffer[row_end:]
+
+    # What follows the sheet data is page setup and the like, small enough to read at once
+    return b''.join(head), buffer[data_end:] + source.read()
+
+
+def column_letter(column_idx):
+    """
+    Convert a 1-based column number to its Excel letters.
+
+    Args:
+        column_idx (int): Column number.
+
+    Returns:
+        str: Column letters, e.g. 'A' or 'AB'.
+    """
+    letters = ''
+    while column_idx:
+        column_idx, remainder = divmod(column_idx - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def row_xml(row_idx, values, column_letters):
+    """
+    Build the XML of one sheet row.
+
+    Strings are written inline, numbers and booleans as values; empty and
+    NaN cells are left out.
+
+    Args:
+        row_idx (int): Row number.
+        values (tuple): Cell values.
+        column_letters (list): Letters of the columns, at least as many as values.
+
+    Returns:
+        str: The row element.
+    """
+    cells = []
+    for letter, value in zip(column_letters, values):
+        if value is None:
+            continue
+        ref = f"{letter}{row_idx}"
+        if isinstance(value, str):
+            cells.append(f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{escape(value)}</t></is></c>')
+        elif isinstance(value, (bool, np.bool_)):
+            cells.append(f'<c r="{ref}" t="b"><v>{int(value)}</v></c>')
+        elif isinstance(value, numbers.Integral):
+            cells.append(f'<c r="{ref}" t="n"><v>{int(value)}</v></c>')
+        elif isinstance(value, numbers.Real):
+            if math.isfinite(value):
+                cells.append(f'<c r="{ref}" t="n"><v>{float(value)!r}</v></c>')
+        else:
+            cells.append(f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{escape(str(value))}</t></is></c>')
+    return f'<row r="{row_idx}">{"".join(cells)}</row>'
+
+
+def without_calc_chain(part_name, data):
+    """
+    Drop the calculation chain from the workbook's package listings.
+
+    Args:
+        part_name (str): Name of the part.
+        data (bytes): Content of the part.
+
+    Returns:
+        bytes: The content with any reference to the calculation chain removed.
+    """
+    if part_name == CONTENT_TYPES_PART:
+        return re.sub(rb'<Override [^>]*PartName="/xl/calcChain\.xml"[^>]*/>', b'', data)
+    if part_name == WORKBOOK_RELS_PART:
+        return re.sub(rb'<Relationship [^>]*Target="[^"]*calcChain\.xml"[^>]*/>', b'', data)
+    return data
+
+
+def with_full_calc_on_load(data):
+    """
+    Make Excel recalculate every formula when the workbook is opened.
+
+    Formula sheets are copied from the template with the results cached
+    there, which are stale once the data sheets change.
+
+    Args:
+        data (bytes): Content of xl/workbook.xml.
+
+    Returns:
+        bytes: The content with fullCalcOnLoad set.
+    """
+    if re.search(rb'<calcPr\b[^>]*\bfullCalcOnLoad=', data):
+        return re.sub(rb'(<calcPr\b[^>]*\bfullCalcOnLoad=)"[^"]*"', rb'\1"1"', data)
+    if b'<calcPr' in data:
+        return data.replace(b'<calcPr', b'<calcPr fullCalcOnLoad="1"', 1)
+    # calcPr goes after the sheets and defined names
+    position = max(data.rfind(marker) + len(marker) for marker in (b'</sheets>', b'</definedNames>'))
+    return data[:position] + b'<calcPr fullCalcOnLoad="1"/>' + data[position:]
+
+
+def write_sheet_part(target, template_source, df, header_rows=HEADER_ROWS):
+    """
+    Stream a data sheet: the template's header and layout with the DataFrame's rows in place of its data.
+
+    Args:
+        target: Writable binary file object of the new sheet part.
+        template_source: Binary file object of the template sheet part.
+        df (pandas.DataFrame): Data written below the header rows.
+        header_rows (int): Number of header rows kept from the template.
+    """
+    head, tail = split_sheet_template(template_source, header_rows)
+    target.write(head)
+    column_letters = [column_letter(column_idx) for column_idx in range(1, len(df.columns) + 1)]
+    batch = []
+    for row_idx, row in enumerate(df.itertuples(index=False, name=None), start=header_rows + 1):
+        batch.append(row_xml(row_idx, row, column_letters))
+        if len(batch) >= ROW_BATCH_SIZE:
+            target.write(''.join(batch).encode('utf-8'))
+            batch = []
+    target.write(''.join(batch).encode('utf-8'))
+    target.write(tail)
+
+
+def regenerate_workbook(template_path, excel_file_path, sheet_dfs, header_rows=HEADER_ROWS):
+    """
+    Write a fresh workbook from a template and the data sheet DataFrames.
+
+    The template is copied part by part without being loaded: formula and
+    summary sheets, styles and everything else come through byte for byte.
+    Each data sheet keeps the template's header rows and layout, with its
+    data rows streamed from the DataFrame. The new workbook is written next
+    to the target and moved into place in one step, so a crash leaves the
+    previous workbook intact.
+
+    Args:
+        template_path (str): Template workbook; may be excel_file_path itself.
+        excel_file_path (str): Path of the workbook to write.
+        sheet_dfs (list): Sheet names and DataFrames, each sheet present in the template.
+        header_rows (int): Number of header rows kept from the template on each data sheet.
+
+    Returns:
+        int: Size of the written workbook in bytes.
+    """
+    sheet_parts = template_sheet_parts(template_path)
+    missing = [sheet_name for sheet_name, _ in sheet_dfs if sheet_name not in sheet_parts]
+    if missing:
+        raise KeyError(f"Template '{template_path}' has no sheet named {', '.join(missing)}")
+    part_dfs = {sheet_parts[sheet_name]: df for sheet_name, df in sheet_dfs}
+
+    def write(temp_path):
+        with zipfile.ZipFile(template_path, 'r') as template, \
+                zipfile.ZipFile(temp_path, 'w', compression=zipfile.ZIP_DEFLATED) as workbook:
+            for info in template.infolist():
+                if info.filename == CALC_CHAIN_PART:
+                    continue
+                part_info = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+                part_info.compress_type = zipfile.ZIP_DEFLATED
+                with template.open(info) as source, workbook.open(part_info, 'w') as target:
+                    if info.filename in part_dfs:
+                        write_sheet_part(target, source, part_dfs[info.filename], header_rows)
+                    elif info.filename == WORKBOOK_PART:
+                        target.write(with_full_calc_on_load(source.read()))
+                    elif info.filename in (CONTENT_TYPES_PART, WORKBOOK_RELS_PART):
+                        target.write(without_calc_chain(info.filename, source.read()))
+                    else:
+                        shutil.copyfileobj(source, target)
+
+    replace_file(excel_file_path, write)
+    return os.path.getsize(excel_file_path)
@@ -0,0 +1,271 @@
+import asyncio
+import ssl
+import urllib.error
+import urllib.parse
+
+# Keep-alive connections opened per server at most, shared by all concurrent requests to it
+MAX_CONNECTIONS_PER_HOST = 8
+MAX_REDIRECTS = 5
+READ_CHUNK_SIZE = 1024 * 1024
+USER_AGENT = "RMA-LRP-Scraper"
+
+
+class Response:
+    """
+    Response to a pooled request, with a body that is streamed on demand.
+
+    The connection goes back to its pool once the body has been read to the
+    end, or is closed if release() is called before that.
+    """
+
+    def __init__(self, pool, origin, connection, method, url, status, reason, headers):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self._pool = pool
+        self._origin = origin
+        self._connection = connection
+        self._reader = connection[0]
+
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            self._remaining = 0
+        elif 'chunked' in headers.get('transfer-encoding', '').lower():
+            self._remaining = None
+        elif 'content-length' in headers:
+            self._remaining = int(headers['content-length'])
+        else:
+            # Body runs to the end of the connection
+            self._remaining = -1
+        self._keep_alive = self._remaining != -1 and headers.get('connection', '').lower() != 'close'
+        if self._remaining == 0:
+            self.release()
+
+    async def iter_chunks(self):
+        """
+        Stream the response body.
+
+        Yields:
+            bytes: Next chunk of the body.
+        """
+        try:
+            if self._remaining is None:
+                async for chunk in self._iter_chunked():
+                    yield chunk
+            elif self._remaining == -1:
+                while True:
+                    chunk = await self._pool.read(self._reader.read(READ_CHUNK_SIZE))
+                    if not chunk:
+                        break
+                    yield chunk
+            else:
+                while self._remaining > 0:
+                    chunk = await self._pool.read(self._reader.read(min(self._remaining, READ_CHUNK_SIZE)))
+                    if not chunk:
+                        raise ConnectionError(f"Connection closed with {self._remaining} bytes of '{self.url}' left")
+                    self._remaining -= len(chunk)
+                    yield chunk
+            self._remaining = 0
+            self.release()
+        finally:
+            # Anything short of the whole body leaves the connection unusable
+            if self._connection is not None:
+                self._keep_alive = False
+                self.release()
+
+    async def _read_chunked_line(self):
+        # An empty read means the connection closed; only an explicit zero-size chunk ends the body
+        line = await self._pool.read(self._reader.readline())
+        if not line.endswith(b'\n'):
+            raise ConnectionError(f"Connection closed in the chunked body of '{self.url}'")
+        return line
+
+    async def _iter_chunked(self):
+        while True:
+            size_line = await self._read_chunked_line()
+            try:
+                size = int(size_line.split(b';')[0].strip(), 16)
+            except ValueError:
+                raise ConnectionError(f"Malformed chunk size {size_line!r} in '{self.url}'")
+            if size == 0:
+                # Skip trailers up to the blank line ending the body
+                while (await self._read_chunked_line()).strip():
+                    pass
+                return
+            while size > 0:
+                chunk = await self._pool.read(self._reader.read(min(size, READ_CHUNK_SIZE)))
+                if not chunk:
+                    raise ConnectionError(f"Connection closed in a chunk of '{self.url}'")
+                size -= len(chunk)
+                yield chunk
+            await self._read_chunked_line()
+
+    async def read(self):
+        """
+        Read the whole response body.
+
+        Returns:
+            bytes: The body.
+        """
+        return b''.join([chunk async for chunk in self.iter_chunks()])
+
+    def release(self):
+        """
+        Hand the connection back to the pool, or close it if the body was not fully read.
+        """
+        if self._connection is not None:
+            # Unread body bytes would be taken for the next response on this connection
+            self._pool.release(self._origin, self._connection, self._keep_alive and self._remaining == 0)
+            self._connection = None
+
+
+class ConnectionPool:
+    """
+    Minimal asyncio HTTP/1.1 client that reuses keep-alive connections per server.
+
+    Concurrent requests to the same server share at most
+    max_connections_per_host connections; the others wait for one to free up.
+    """
+
+    def __init__(self, max_connections_per_host=MAX_CONNECTIONS_PER_HOST, timeout=60):
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = timeout
+        self._idle = {}
+        self._slots = {}
+        self._ssl_context = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def read(self, awaitable):
+        """
+        Await a socket read, failing after the pool's timeout.
+
+        Args:
+            awaitable: Read on a connection's stream.
+
+        Returns:
+            bytes: The data read.
+        """
+        return await asyncio.wait_for(awaitable, self.timeout)
+
+    async def request(self, method, url, headers=None, follow_redirects=True):
+        """
+        Send a request on a pooled connection and read the response headers.
+
+        The body is not read; stream it with Response.iter_chunks() or read(),
+        or call Response.release() to discard it.
+
+        Args:
+            method (str): HTTP method.
+            url (str): http:// or https:// URL.
+            headers (dict): Extra request headers.
+            follow_redirects (bool): Follow 301/302/303/307/308 responses.
+
+        Returns:
+            Response: The response.
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            response = await self._send(method, url, headers or {})
+            if not follow_redirects or response.status not in (301, 302, 303, 307, 308) \
+                    or 'location' not in response.headers:
+                return response
+            await response.read()
+            url = urllib.parse.urljoin(url, response.headers['location'])
+        raise urllib.error.HTTPError(url, response.status, "Too many redirects", None, None)
+
+    async def _send(self, method, url, headers):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f"Unsupported URL scheme in '{url}'")
+        origin = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+        target = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+        host = parts.hostname if parts.port is None else f"{parts.hostname}:{parts.port}"
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {host}", f"User-Agent: {USER_AGENT}",
+                 "Accept-Encoding: identity"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        request_bytes = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+        slots = self._slots.setdefault(origin, asyncio.Semaphore(self.max_connections_per_host))
+        await slots.acquire()
+        connection = None
+        try:
+            # A pooled connection may have been closed by the server; retry once on a new one
+            for attempt in range(2):
+                connection, reused = await self._connect(origin)
+                try:
+                    connection[1].write(request_bytes)
+                    await connection[1].drain()
+                    status_line = await self.read(connection[0].readline())
+                    if not status_line:
+                        raise ConnectionResetError(f"Connection closed before a response from '{url}'")
+                    break
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    connection[1].close()
+                    connection = None
+                    if not reused or attempt:
+                        raise
+            version, status, reason = (status_line.decode('latin-1').rstrip('\r\n').split(' ', 2) + ['', ''])[:3]
+            if not (version.startswith('HTTP/') and status.isdigit() and len(status) == 3):
+                raise ConnectionError(f"Malformed status line {status_line!r} from '{url}'")
+            response_headers = {}
+            while True:
+                line = await self.read(connection[0].readline())
+                if not line.strip():
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                response_headers[name.strip().lower()] = value.strip()
+            if version == 'HTTP/1.0' and response_headers.get('connection', '').lower() != 'keep-alive':
+                response_headers['connection'] = 'close'
+            if not response_headers.get('content-length', '0').isdigit():
+                raise ConnectionError(f"Malformed Content-Length from '{url}'")
+        except BaseException:
+            if connection is not None:
+                connection[1].close()
+            slots.release()
+            raise
+        return Response(self, origin, connection, method, url, int(status), reason, response_headers)
+
+    async def _connect(self, origin):
+        idle = self._idle.get(origin)
+        while idle:
+            connection = idle.pop()
+            if not connection[0].at_eof():
+                return connection, True
+            connection[1].close()
+        scheme, hostname, port = origin
+        ssl_context = None
+        if scheme == 'https':
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            ssl_context = self._ssl_context
+        connection = await asyncio.wait_for(
+            asyncio.open_connection(hostname, port, ssl=ssl_context), self.timeout)
+        return connection, False
+
+    def release(self, origin, connection, keep_alive):
+        """
+        Return a connection after its response was handled.
+
+        Args:
+            origin (tuple): (scheme, host, port) the connection belongs to.
+            connection (tuple): (reader, writer) stream pair.
+            keep_alive (bool): Keep the connection for later requests; otherwise close it.
+        """
+        if keep_alive:
+            self._idle.setdefault(origin, []).append(connection)
+        else:
+            connection[1].close()
+        self._slots[origin].release()
+
+    async def close(self):
+        """
+        Close every idle connection.
+        """
+        for connections in self._idle.values():
+            for _, writer in connections:
+                writer.close()
+        self._idle.clear()
@@ -0,0 +1,212 @@
+import cProfile
+import datetime
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# Report of the run in progress; stages are only recorded after start_run()
+_current_run = None
+
+
+def process_memory_counters():
+    """
+    Get the memory counters of this process on Windows.
+
+    Returns:
+        ctypes.Structure: PROCESS_MEMORY_COUNTERS, or None if they could not be read.
+    """
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [
+            ('cb', wintypes.DWORD),
+            ('PageFaultCount', wintypes.DWORD),
+            ('PeakWorkingSetSize', ctypes.c_size_t),
+            ('WorkingSetSize', ctypes.c_size_t),
+            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+            ('PagefileUsage', ctypes.c_size_t),
+            ('PeakPagefileUsage', ctypes.c_size_t),
+        ]
+
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+        return counters
+    return None
+
+
+def peak_rss_bytes():
+    """
+    Get the peak resident set size of this process so far.
+
+    Returns:
+        int: Peak RSS in bytes, or None if the platform does not report it.
+    """
+    if sys.platform == 'win32':
+        counters = process_memory_counters()
+        return counters.PeakWorkingSetSize if counters is not None else None
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def current_rss_bytes():
+    """
+    Get the resident set size of this process right now.
+
+    Returns:
+        int: RSS in bytes, or None if the platform does not report it.
+    """
+    if sys.platform == 'win32':
+        counters = process_memory_counters()
+        return counters.WorkingSetSize if counters is not None else None
+    try:
+        # Resident pages are the second field
+        with open('/proc/self/statm', 'r') as statm_file:
+            return int(statm_file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def start_run(**fields):
+    """
+    Start recording a new run report, replacing any previous one.
+
+    Args:
+        **fields: Values stored at the top level of the report, e.g. the file date.
+
+    Returns:
+        dict: The new run report.
+    """
+    global _current_run
+    _current_run = {
+        'started_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        **fields,
+        'stages': [],
+        '_start': time.perf_counter(),
+    }
+    return _current_run
+
+
+@contextmanager
+def stage(name, **fields):
+    """
+    Time a pipeline stage and record it in the current run report.
+
+    The yielded dict can be filled in by the stage with counts such as
+    'rows' or 'bytes'. The RSS before and after the stage, and the change
+    between them, show the memory the stage itself held on to; the process
+    peak RSS is recorded alongside. Nothing is recorded when no run has
+    been started.
+
+    Args:
+        name (str): Stage name, e.g. 'download' or 'sheet:809_Sheet'.
+        **fields: Extra values stored with the stage.
+
+    Yields:
+        dict: The stage record.
+    """
+    record = {'name': name, **fields}
+    rss_before = current_rss_bytes()
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record['error'] = str(e)
+        raise
+    finally:
+        record['seconds'] = round(time.perf_counter() - start, 6)
+        rss_after = current_rss_bytes()
+        record['rss_before_bytes'] = rss_before
+        record['rss_after_bytes'] = rss_after
+        record['rss_delta_bytes'] = rss_after - rss_before if rss_before is not None and rss_after is not None \
+            else None
+        record['peak_rss_bytes'] = peak_rss_bytes()
+        if _current_run is not None:
+            _current_run['stages'].append(record)
+
+
+@contextmanager
+def collected_stages():
+    """
+    Record stages into a list of their own, e.g. in a worker process whose stages the parent reports.
+
+    Yields:
+        list: The stage records made inside the block.
+    """
+    global _current_run
+    previous_run = _current_run
+    _current_run = {'stages': []}
+    try:
+        yield _current_run['stages']
+    finally:
+        _current_run = previous_run
+
+
+def merge_stages(records, **fields):
+    """
+    Add stage records made elsewhere, e.g. in a worker process, to the current run report.
+
+    Args:
+        records (list): Stage records from collected_stages.
+        **fields: Extra values stored with each record, e.g. the worker's process id.
+    """
+    if _current_run is not None:
+        _current_run['stages'].extend({**record, **fields} for record in records)
+
+
+def write_run_report(report_directory):
+    """
+    Finish the current run and write its report as JSON.
+
+    Args:
+        report_directory (str): Directory the report is written to.
+
+    Returns:
+        str: Path to the report, or None if no run was started.
+    """
+    if _current_run is None:
+        return None
+    os.makedirs(report_directory, exist_ok=True)
+    report = {key: value for key, value in _current_run.items() if not key.startswith('_')}
+    report['total_seconds'] = round(time.perf_counter() - _current_run['_start'], 6)
+    report['peak_rss_bytes'] = peak_rss_bytes()
+
+    stamp = datetime.datetime.fromisoformat(report['started_at']).strftime("%Y%m%d_%H%M%S")
+    report_path = os.path.join(report_directory, f"run_{stamp}.json")
+    with open(report_path, 'w') as report_file:
+        json.dump(report, report_file, indent=2, default=str)
+    return report_path
+
+
+@contextmanager
+def profiled(profile_path):
+    """
+    Run a block under cProfile and dump the stats, if a path is given.
+
+    Args:
+        profile_path (str): Where to write the .prof file, or None to skip profiling.
+    """
+    if profile_path is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(os.path.dirname(profile_path) or '.', exist_ok=True)
+        profiler.dump_stats(profile_path)
@@ -0,0 +1,269 @@
+import csv
+import math
+import zipfile
+from array import array
+from operator import itemgetter
+import numpy as np
+import pandas as pd
+from raw_cache import block_ranges, open_raw_cache, read_ranges
+
+# Fields used to partition the LrpRate file into sheets
+PARTITION_KEY_FIELDS = ('Commodity Code', 'State Code', 'Type Code')
+
+# Projection of the LrpRate layout: the columns written to a sheet, in sheet order, by header name.
+# Each has a storage type and, for floats, the number of decimals RMA writes.
+# Codes and dates repeat across rows, so each distinct value is stored once.
+# Columns not listed here are never decoded or stored.
+LRP_RATE_SCHEMA = {
+    'Record Type Code': ('category', None),
+    'Commodity Code': ('category', None),
+    'Endorsement Length Count': ('int16', None),
+    'Coverage Price': ('float64', 3),
+    'Endorsement Length Code': ('category', None),
+    'Target Low Weight': ('float64', 2),
+    'Target High Weight': ('float64', 2),
+    'Expected Ending Value Amount': ('float64', 3),
+    'Livestock Coverage Level Percent': ('float64', 6),
+    'Livestock Rate': ('float64', 6),
+    'Cost Per Cwt Amount': ('float64', 3),
+    'Filing Date': ('date', None),
+}
+
+# RMA date format
+LRP_RATE_DATE_FORMAT = '%Y%m%d'
+
+# Rows of raw text buffered before they are converted to their storage types
+PARSE_CHUNK_ROWS = 65536
+
+
+def find_lrp_rate_member(zip_ref):
+    """
+    Find the LrpRate text file inside an ADM daily zip.
+
+    Args:
+        zip_ref (zipfile.ZipFile): Open ADM daily zip.
+
+    Returns:
+        str: Name of the LrpRate member.
+    """
+    for file_name in zip_ref.namelist():
+        if 'LrpRate' in file_name:
+            return file_name
+    raise Exception(f"No LrpRate file found in '{zip_ref.filename}'.")
+
+
+# Parse an RMA decimal field; blank fields become NaN
+def parse_float(value):
+    return float(value) if value else math.nan
+
+
+def validate_lrp_rate_header(header):
+    """
+    Check an LrpRate header against the projection and locate the needed columns.
+
+    Columns are looked up by name, so a reordered layout still works, but a
+    renamed, missing or repeated column stops the run instead of silently
+    reading the wrong values.
+
+    Args:
+        header (list): Header row of the LrpRate file.
+
+    Returns:
+        dict: Column name to position in the file, for every projected and partition key column.
+    """
+    required_names = list(LRP_RATE_SCHEMA) + [name for name in PARTITION_KEY_FIELDS if name not in LRP_RATE_SCHEMA]
+    missing_names = [name for name in required_names if name not in header]
+    repeated_names = [name for name in required_names if header.count(name) > 1]
+    if missing_names or repeated_names:
+        problems = []
+        if missing_names:
+            problems.append(f"missing {', '.join(missing_names)}")
+        if repeated_names:
+            problems.append(f"repeated {', '.join(repeated_names)}")
+        raise Exception(f"Unexpected LrpRate layout: {'; '.join(problems)}.")
+    return {name: header.index(name) for name in required_names}
+
+
+def column_builder(dtype):
+    """
+    Start collecting one LrpRate column as typed values while the file is streamed.
+
+    Numbers are parsed into a compact array. Codes and dates are interned:
+    each row stores a small index into the distinct values seen.
+
+    Args:
+        dtype (str): Storage type from LRP_RATE_SCHEMA.
+
+    Returns:
+        tuple: The value array, the dict of interned values, and the function
+            converting and appending a chunk of raw values.
+    """
+    categories = {}
+    if dtype in ('category', 'date'):
+        values = array('H')
+
+        def extend(chunk):
+            for value in set(chunk).difference(categories):
+                categories[value] = len(categories)
+            values.extend(map(categories.__getitem__, chunk))
+    elif dtype == 'int16':
+        values = array('h')
+
+        def extend(chunk):
+            values.extend(array('h', map(int, chunk)))
+    else:
+        values = array('d')
+
+        def extend(chunk):
+            try:
+                converted = array('d', map(float, chunk))
+            except ValueError:
+                converted = array('d', map(parse_float, chunk))
+            values.extend(converted)
+    return values, categories, extend
+
+
+def finish_column(dtype, values, categories):
+    """
+    Convert the values collected by column_builder into a column.
+
+    Args:
+        dtype (str): Storage type from LRP_RATE_SCHEMA.
+        values (array.array): Collected values or interned value indexes.
+        categories (dict): Interned values.
+
+    Returns:
+        numpy.ndarray or pandas.Categorical: Typed column.
+    """
+    values = np.frombuffer(values, dtype=values.typecode) if values else np.empty(0, dtype=values.typecode)
+    if dtype == 'category':
+        return pd.Categorical.from_codes(values.astype(np.int16), categories=list(categories))
+    if dtype == 'date':
+        dates = pd.to_datetime(list(categories), format=LRP_RATE_DATE_FORMAT, errors='coerce')
+        return dates.to_numpy(dtype='datetime64[ns]')[values]
+    return values
+
+
+def read_lrp_rate_columns(zip_path, partition_keys=None, cache_directory=None):
+    """
+    Read the LrpRate rows of an ADM zip into typed columns.
+
+    The LrpRate file is extracted once next to the zip, with an index of the
+    byte ranges of each (commodity, state, type) block. Reads go through a
+    memory map and decode only the ranges of the requested partitions. Only
+    the LRP_RATE_SCHEMA columns are kept, and the header is validated first.
+
+    Args:
+        zip_path (str): Path to the ADM daily zip.
+        partition_keys (set): (commodity, state, type) code tuples to keep, or None to keep every partition.
+        cache_directory (str): Directory the LrpRate file is extracted into, or None for the zip's own directory.
+
+    Returns:
+        tuple: Column names in sheet order, list of typed columns (numpy arrays, or pandas.Categorical
+            for codes), and a dict of (commodity, state, type) code tuples to the row
+            positions of that partition.
+    """
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        member = find_lrp_rate_member(zip_ref)
+    text_path, index = open_raw_cache(zip_path, member, PARTITION_KEY_FIELDS, validate_lrp_rate_header,
+                                      cache_directory)
+
+    positions = validate_lrp_rate_header(index['header'])
+    get_partition_key = itemgetter(*[positions[name] for name in PARTITION_KEY_FIELDS])
+    get_kept_values = itemgetter(*[positions[name] for name in LRP_RATE_SCHEMA])
+    dtypes = [dtype for dtype, _ in LRP_RATE_SCHEMA.values()]
+    builders = [column_builder(dtype) for dtype in dtypes]
+    # Raw text is buffered a chunk at a time, then converted column by column
+    chunk_columns = [[] for _ in LRP_RATE_SCHEMA]
+
+    def flush_chunk():
+        for (_, _, extend), chunk in zip(builders, chunk_columns):
+            extend(chunk)
+            chunk.clear()
+
+    partition_index = {}
+    row_position = 0
+    reader = csv.reader(read_ranges(text_path, block_ranges(index, partition_keys)), delimiter='|')
+    for row in reader:
+        if not row:
+            continue
+        partition_key = get_partition_key(row)
+        if partition_keys is not None and partition_key not in partition_keys:
+            continue
+        rows = partition_index.get(partition_key)
+        if rows is None:
+            rows = partition_index[partition_key] = []
+        rows.append(row_position)
+        for chunk, value in zip(chunk_columns, get_kept_values(row)):
+            chunk.append(value)
+        row_position += 1
+        if row_position % PARSE_CHUNK_ROWS == 0:
+            flush_chunk()
+    flush_chunk()
+
+    columns = [finish_column(dtype, values, categories) for dtype, (values, categories, _) in zip(dtypes, builders)]
+    return list(LRP_RATE_SCHEMA), columns, partition_index
+
+
+def build_partitions(column_names, columns, partition_index):
+    """
+    Split flat LrpRate columns into one DataFrame per partition.
+
+    Args:
+        column_names (list): Column names.
+        columns (list): Typed columns from read_lrp_rate_columns.
+        partition_index (dict): Row positions keyed by (commodity, state, type) code tuples.
+
+    Returns:
+        dict: Mapping of (commodity, state, type) code tuples to DataFrames.
+    """
+    df = pd.DataFrame(dict(zip(column_names, columns)))
+    return {
+        partition_key: df.take(rows).reset_index(drop=True)
+        for partition_key, rows in partition_index.items()
+    }
+
+
+def published_values(df, column):
+    """
+    Take a numeric LrpRate column as float64 values rounded to the decimals RMA publishes.
+
+    The quote store keeps float32 values, so rounding makes them match the
+    sheet values in exact lookups and price calculations.
+
+    Args:
+        df (pandas.DataFrame): Typed sheet DataFrame or stored quotes.
+        column (str): LRP_RATE_SCHEMA column name.
+
+    Returns:
+        numpy.ndarray: Rounded values.
+    """
+    return df[column].to_numpy(dtype='float64').round(LRP_RATE_SCHEMA[column][1] or 0)
+
+
+def format_lrp_rate_columns(df):
+    """
+    Format typed LrpRate columns back into the text RMA publishes.
+
+    Sheets have always held the values exactly as they appear in the file,
+    so they are written back with the same decimals and date format.
+    Columns outside LRP_RATE_SCHEMA are left as they are.
+
+    Args:
+        df (pandas.DataFrame): DataFrame with typed LrpRate columns.
+
+    Returns:
+        pandas.DataFrame: Copy of the DataFrame with the LrpRate columns as text.
+    """
+    df = df.copy()
+    for column in df.columns:
+        if column not in LRP_RATE_SCHEMA:
+            continue
+        dtype, decimals = LRP_RATE_SCHEMA[column]
+        if dtype == 'date':
+            df[column] = df[column].dt.strftime(LRP_RATE_DATE_FORMAT)
+        elif dtype == 'float64':
+            df[column] = [f"{value:.{decimals}f}" if not math.isnan(value) else '' for value in df[column]]
+        else:
+            df[column] = df[column].astype(str)
+    return df
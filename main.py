@@ -1,241 +1,696 @@
+import argparse
 import datetime
-import urllib.request
+import functools
+import multiprocessing
 import os
-import zipfile
-import csv
-import pandas as pd
-from openpyxl import load_workbook
-import time
+import socket
+import urllib.parse
 import sys
+import time
+from atomic_file import replace_file
+from commodity_registry import check_written_sheet_names, load_registry
+from concurrent.futures import ProcessPoolExecutor
+from download import backoff_delays, fetch_cached, is_url_published, load_cache_index, wait_for_publication
+from instrumentation import collected_stages, merge_stages, profiled, stage, start_run, write_run_report
+# pandas, numpy, openpyxl and pyarrow (and the modules built on them) are imported
+# inside the functions that use them, so starting up and probing stay fast
 
 # Constants
-TARGET_STATE_CODE = '19'
-MAX_RETRIES = 24
+# Commodities, types, sheets, states and subsidy schedules, next to the program (or its frozen executable)
+REGISTRY_PATH = os.path.join(
+    os.path.dirname(sys.executable if getattr(sys, 'frozen', False) else os.path.abspath(__file__)),
+    "commodities.toml",
+)
+# Sheets are built across this many processes once there are at least FANOUT_MIN_OUTPUTS of them
+FANOUT_PROCESSES = os.cpu_count()
+FANOUT_MIN_OUTPUTS = 16
+MAX_RETRIES = 5
+PUBLICATION_DEADLINE_SECONDS = 2 * 60 * 60
+PROBE_TIMEOUT_SECONDS = 5
+# --probe exit code when the RMA server could not be reached; 0 is published, 1 is not published yet
+PROBE_UNREACHABLE_EXIT_CODE = 2
 SAVE_DIRECTORY = "var/"
 EXCEL_FILE_PATH = "LRP_Swine.xlsx"
+QUOTE_STORE_DIRECTORY = os.path.join(SAVE_DIRECTORY, "quotes")
+REPORT_DIRECTORY = os.path.join(SAVE_DIRECTORY, "reports")
+OUTPUT_DIRECTORY = os.path.join(SAVE_DIRECTORY, "outputs")
+ARCHIVE_DIRECTORY = os.path.join(SAVE_DIRECTORY, "archive")
+BASE_URL = "https://pubfs-rma.fpac.usda.gov/pub/References/adm_livestock/"
+
+# Daemon setting: time of day the resident process runs each daily cycle (HH:MM)
+DAEMON_RUN_TIME = "07:00"
+
+# Profiling setting: also dump a cProfile of each run next to its JSON run report
+PROFILE_RUN = False
+
+# Output setting: extra targets written alongside the workbook, concurrently and from the same DataFrames
+# Any of 'commodity_workbooks', 'csv', 'html' and 'pdf' (needs pdfkit and wkhtmltopdf)
+OUTPUT_TARGETS = []
 
-# Commodity directory configuration
-NEW_COMMODITY_DIRECTORY = {
-    '0801': {
-        'directory_name': 'FeederCattle',
-        'sub_sheets': {
-            '809': '809_Sheet',
-            '810': '810_Sheet',
-            '811': '811_Sheet',
-            '812': '812_Sheet',
-        }
-    },
-    '0815': {
-        'directory_name': 'FeederCattle',
-        'sub_sheets': {
-            '997': '997_Sheet',
-            '821': '821_Sheet',
-        }
-    },
-    '0802': {
-        'directory_name': 'FedCattle',
-        'sub_sheets': {'820': '820_Sheet'}
-    },
-}
-
-# Developer mode setting
-dev_mode = input('Press ENTER to Skip or type "yes" to Enter Dev Mode: ')
-OVERWRITE_DATE = None
-if dev_mode.lower() == 'yes':
-    OVERWRITE_DATE = input("Enter the OVERWRITE_DATE (YYYYMMDD format), or press Enter to use the default: ")
-
-# Check internet connectivity
-def is_internet_available():
+# Incremental update setting: load the workbook, diff against the rows already in each sheet and write only
+# changed cells. When off, the workbook is regenerated from WORKBOOK_TEMPLATE_PATH without being loaded.
+INCREMENTAL_UPDATE = False
+# Workbook whose header rows, formula sheets and formatting the workbook is regenerated from;
+# None uses the workbook itself
+WORKBOOK_TEMPLATE_PATH = None
+# Each sub-sheet holds one Type Code, so these columns identify a row within it
+DIFF_KEY_COLUMNS = ['Endorsement Length Count', 'Coverage Price']
+
+# Commodity directory configuration, checked and compiled once at startup
+# Each commodity has its 'directory_name', 'sub_sheets' and 'subsidy_bands'
+REGISTRY = load_registry(REGISTRY_PATH)
+TARGET_STATE_CODE = REGISTRY['target_state_code']
+# States to build sheets for; sheets for states other than TARGET_STATE_CODE get the state code appended
+TARGET_STATE_CODES = REGISTRY['state_codes']
+NEW_COMMODITY_DIRECTORY = REGISTRY['commodities']
+
+# Check the RMA server is reachable with a TCP connect, without sending a request over it
+def is_internet_available(url=BASE_URL, timeout=PROBE_TIMEOUT_SECONDS):
+    parts = urllib.parse.urlsplit(url)
     try:
-        urllib.request.urlopen('http://www.google.com', timeout=2)
+        socket.create_connection((parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80)),
+                                 timeout).close()
         return True
-    except urllib.request.URLError:
+    except OSError:
         return False
 
-# Validate URL
-def is_url_valid(url):
-    try:
-        with urllib.request.urlopen(url) as response:
-            return response.status == 200
-    except Exception:
-        return False
+# Reinsurance years run July 1 through June 30 and are named for the year they end in
+def reinsurance_year(date):
+    return date.year + 1 if date.month >= 7 else date.year
 
-# Validate downloaded file
-def is_file_valid(filepath):
-    return os.path.exists(filepath) and os.path.getsize(filepath) > 0
+# Build the ADM daily zip URL for a YYYYMMDD date string
+def build_url(date_str):
+    year = reinsurance_year(datetime.datetime.strptime(date_str, "%Y%m%d"))
+    return f"{BASE_URL}{year}/{year}_ADMLivestockLrp_Daily_{date_str}.zip"
 
 
-def commodity_sheet_build(csv_data, key, sub_key, sub_value):
+# Sheet name of a sub-sheet for a given state
+def sheet_name_for(sub_value, state_code):
+    return sub_value if state_code == TARGET_STATE_CODE else f"{sub_value}_{state_code}"
+
+def output_matrix(state_codes=None, commodity_codes=None):
+    """
+    List every configured state x commodity x type output.
+
+    Args:
+        state_codes (list): States to include, or None for TARGET_STATE_CODES.
+        commodity_codes (list): Commodities to include, or None for all of NEW_COMMODITY_DIRECTORY.
+
+    Returns:
+        list: (commodity code, state code, type code, sheet name) tuples.
+    """
+    return [
+        (key, state_code, sub_key, sheet_name_for(sub_value, state_code))
+        for state_code in (state_codes or TARGET_STATE_CODES)
+        for key, value in NEW_COMMODITY_DIRECTORY.items()
+        if 'sub_sheets' in value and (not commodity_codes or key in commodity_codes)
+        for sub_key, sub_value in value['sub_sheets'].items()
+    ]
+
+def commodity_sheet_build(partitions, key, sub_key, sub_value, state_code=TARGET_STATE_CODE):
     """
     Process each commodity and return sheet name and DataFrame.
 
+    A state that does not quote a type on the day has no rows for it; that
+    sheet is skipped with a warning, and its stage record is marked skipped.
+
     Args:
-        csv_data (list): List of dictionaries representing CSV data.
+        partitions (dict): DataFrames keyed by (commodity, state, type) codes.
         key (str): Commodity code.
         sub_key (str): Sub commodity code.
         sub_value (str): Sheet name.
+        state_code (str): State code.
 
     Returns:
-        tuple: Sheet name and DataFrame.
+        tuple: Sheet name and DataFrame, or None if the file has no rows for the sheet.
     """
+    from premium import producer_premium
+
     sheet_name = sub_value
     print(f"Processing {sheet_name} ({key})")
 
-    # Filter rows with specified commodity and state codes
-    matching_rows = [
-        row for row in csv_data
-        if row.get('Commodity Code', '') == key and
-           row.get('State Code', '') == TARGET_STATE_CODE and
-           row.get('Type Code', '') == sub_key
-    ]
+    with stage(f"sheet:{sheet_name}") as record:
+        # Look up rows with specified commodity, state and type codes
+        df = partitions.get((key, state_code, sub_key))
+        if df is None:
+            record['skipped'] = 'no rows'
+            print(f"Warning: no rows found for {sheet_name} ({key}), skipping it")
+            return None
 
-    # Create DataFrame and process data
-    df = pd.DataFrame(matching_rows)
-    df = df.sort_values(by=[df.columns[11], df.columns[12]]).reset_index(drop=True)
-    columns_to_drop = list(range(1, 4)) + list(range(5, 11)) + list(range(13, 21)) + list(range(28, 34))
-    df = df.drop(df.columns[columns_to_drop], axis=1)
+        # Sort by endorsement length and coverage price
+        df = df.sort_values(by=['Endorsement Length Count', 'Coverage Price']).reset_index(drop=True)
+        record['rows'] = len(df)
+
+    # Calculate the subsidized producer premium for the whole sheet at once
+    with stage(f"premium:{sheet_name}", rows=len(df)):
+        df['NewColumn'] = producer_premium(df['Livestock Coverage Level Percent'], df['Cost Per Cwt Amount'],
+                                           NEW_COMMODITY_DIRECTORY[key]['subsidy_bands'])
+    print(f"Updated Producer Premium for: {sheet_name}")
 
     print(f"Succesfully Processed {sheet_name} ({key})")
     return sheet_name, df
 
-def download_and_extract_file(url, save_directory, max_retries):
+def build_shared_sheet(descriptors, row_positions, key, state_code, sub_key, sheet_name):
     """
-    Download and extract a file from a given URL.
+    Build one sheet in a worker process from columns held in shared memory.
+
+    Only the rows of this sheet's partition are copied out of the shared columns.
+    The worker's stage records are sent back with the sheet, as its run report
+    lives in the parent process.
+
+    Args:
+        descriptors (list): Shared column descriptors from shared_columns.
+        row_positions (list): Row positions of the partition, or None if it has no rows.
+        key (str): Commodity code.
+        state_code (str): State code.
+        sub_key (str): Sub commodity code.
+        sheet_name (str): Sheet name.
+
+    Returns:
+        tuple: Sheet name, DataFrame (None if the sheet has no rows), the worker's stage records and its process id.
+    """
+    import pandas as pd
+    from shared_columns import attach_columns
+
+    partitions = {}
+    if row_positions is not None:
+        blocks, arrays = attach_columns(descriptors)
+        partitions[(key, state_code, sub_key)] = pd.DataFrame({
+            name: array[row_positions] if categories is None else
+            pd.Categorical.from_codes(array[row_positions], categories=categories)
+            for name, (array, categories) in arrays.items()
+        })
+        del arrays
+        for block in blocks:
+            block.close()
+    with collected_stages() as records:
+        sheet = commodity_sheet_build(partitions, key, sub_key, sheet_name, state_code)
+    return sheet_name, sheet[1] if sheet is not None else None, records, os.getpid()
+
+def build_commodity_dfs(zip_path, processes=FANOUT_PROCESSES, outputs=None, cache_directory=None):
+    """
+    Read an ADM daily zip and build the DataFrame for every configured output sheet.
+
+    The file is parsed once. With enough outputs, the sheets are built across
+    a process pool that reads the parsed columns from shared memory. Sheets
+    the file has no rows for are left out.
+
+    Args:
+        zip_path (str): Path to the ADM daily zip.
+        processes (int): Number of processes to build sheets with; 1 builds them in this process.
+        outputs (list): Outputs from output_matrix to build, or None for every configured output.
+        cache_directory (str): Directory the LrpRate file is extracted into, or None for the zip's own directory.
+
+    Returns:
+        list: List of tuples containing sheet names and corresponding DataFrames.
+    """
+    from lrp_rate import build_partitions, read_lrp_rate_columns
+    from shared_columns import shared_columns
+
+    outputs = outputs or output_matrix()
+    partition_keys = {(key, state_code, sub_key) for key, state_code, sub_key, _ in outputs}
+    with stage('parse', bytes=os.path.getsize(zip_path)) as record:
+        column_names, columns, partition_index = read_lrp_rate_columns(zip_path, partition_keys, cache_directory)
+        record['rows'] = sum(len(rows) for rows in partition_index.values())
+
+    if processes and processes > 1 and len(outputs) >= FANOUT_MIN_OUTPUTS:
+        with stage('fanout', outputs=len(outputs), processes=processes):
+            with shared_columns(column_names, columns) as descriptors:
+                with ProcessPoolExecutor(max_workers=processes) as pool:
+                    futures = [
+                        pool.submit(build_shared_sheet, descriptors, partition_index.get((key, state_code, sub_key)),
+                                    key, state_code, sub_key, sheet_name)
+                        for key, state_code, sub_key, sheet_name in outputs
+                    ]
+                    commodity_dfs = []
+                    for future in futures:
+                        sheet_name, df, records, pid = future.result()
+                        merge_stages(records, pid=pid)
+                        if df is not None:
+                            commodity_dfs.append((sheet_name, df))
+                    return commodity_dfs
+
+    partitions = build_partitions(column_names, columns, partition_index)
+    sheets = [
+        commodity_sheet_build(partitions, key, sub_key, sheet_name, state_code)
+        for key, state_code, sub_key, sheet_name in outputs
+    ]
+    return [sheet for sheet in sheets if sheet is not None]
+
+# Map each output's sheet name back to its (commodity, state, type) codes
+def sheet_codes_for(outputs=None):
+    return {
+        sheet_name: (key, state_code, sub_key)
+        for key, state_code, sub_key, sheet_name in (outputs or output_matrix())
+    }
+
+def sheet_partition_dfs(commodity_dfs, outputs=None):
+    """
+    Key the commodity DataFrames by their (commodity, type) codes instead of sheet name.
+
+    Sheets for different states of the same commodity and type are combined,
+    with a 'State Code' column telling them apart.
+
+    Args:
+        commodity_dfs (list): List of tuples containing sheet names and corresponding DataFrames.
+        outputs (list): Outputs from output_matrix the DataFrames were built for, or None for every configured output.
+
+    Returns:
+        dict: DataFrames keyed by (commodity code, type code).
+    """
+    import pandas as pd
+
+    sheet_codes = sheet_codes_for(outputs)
+    grouped = {}
+    for sheet_name, df in commodity_dfs:
+        key, state_code, sub_key = sheet_codes[sheet_name]
+        grouped.setdefault((key, sub_key), []).append(df.assign(**{'State Code': state_code}))
+    return {codes: pd.concat(dfs, ignore_index=True) for codes, dfs in grouped.items()}
+
+def download_and_extract_file(url, save_directory, max_retries, outputs=None, parse_cache=None):
+    """
+    Download a file from a given URL and build the commodity DataFrames from it.
 
     Args:
         url (str): URL to download the file from.
         save_directory (str): Directory to save the downloaded file.
         max_retries (int): Maximum number of retry attempts.
+        outputs (list): Outputs from output_matrix to build, or None for every configured output.
+        parse_cache (dict): DataFrames from earlier runs keyed by zip path, reused while the zip is unchanged.
 
     Returns:
         list: List of tuples containing sheet names and corresponding DataFrames.
     """
+    from archive import archive_zip
+
+    # Only the download is retried; parsing the same file again would fail the same way
+    filename = os.path.basename(url)
+    zip_path = None
     retry_count = 0
+    retry_delays = backoff_delays()
     while retry_count < max_retries:
         try:
-            filename = os.path.basename(url)
-            if not os.path.exists(save_directory):
-                os.makedirs(save_directory)
-            urllib.request.urlretrieve(url, os.path.join(save_directory, filename))
-            print(f"File '{filename}' downloaded successfully to '{save_directory}'")
-
-            with zipfile.ZipFile(os.path.join(save_directory, filename), 'r') as zip_ref:
-                zip_ref.extractall(save_directory)
-
-                for file_name in zip_ref.namelist():
-                    if 'LrpRate' in file_name:
-                        csv_file_path = os.path.join(save_directory, file_name)
-                        with open(csv_file_path, 'r') as csv_file:
-                            csv_data = list(csv.DictReader(csv_file, delimiter='|'))
-                            commodity_dfs = [
-                                commodity_sheet_build(csv_data, key, sub_key, sub_value)
-                                for key, value in NEW_COMMODITY_DIRECTORY.items()
-                                if 'sub_sheets' in value
-                                for sub_key, sub_value in value['sub_sheets'].items()
-                            ]
-                            return commodity_dfs
+            with stage('download', attempt=retry_count + 1) as record:
+                zip_path, downloaded = fetch_cached(url, save_directory)
+                record['bytes'] = os.path.getsize(zip_path)
+                record['downloaded'] = downloaded
+            if downloaded:
+                print(f"File '{filename}' downloaded successfully to '{save_directory}'")
+            else:
+                print(f"File '{filename}' in '{save_directory}' is current, skipping download")
 
+            # CRC-check the zip and keep a single content-addressed copy of it
+            with stage('archive'):
+                archive_zip(ARCHIVE_DIRECTORY, zip_path, url)
             break
         except Exception as e:
-            print(f"Error downloading or processing file: {e}")
+            print(f"Error downloading file: {e}")
+            zip_path = None
             retry_count += 1
             if retry_count < max_retries:
-                print("Retrying in 5 minutes...")
-                time.sleep(300)
+                delay = next(retry_delays)
+                print(f"Retrying in {delay:.0f} seconds...")
+                time.sleep(delay)
 
-    if retry_count >= max_retries:
+    if zip_path is None:
         print(f"Maximum retries reached. File '{filename}' not downloaded.")
+        return None
 
-# URL construction
-base_url = "https://pubfs-rma.fpac.usda.gov/pub/References/adm_livestock/"
-year = datetime.datetime.now().year + 1
-current_date_str = datetime.datetime.now().strftime("%Y%m%d") if not OVERWRITE_DATE else OVERWRITE_DATE
-filename = f"{year}_ADMLivestockLrp_Daily_{current_date_str}.zip"
-url = f"{base_url}{year}/{filename}"
-print(f"Gathering RMA Data for Date: {current_date_str}")
-print(f"Gathering RMA Data from URL: {url}")
+    if parse_cache is None:
+        return build_commodity_dfs(zip_path, outputs=outputs)
+    signature = (os.path.getmtime(zip_path), os.path.getsize(zip_path), tuple(outputs or output_matrix()))
+    cached = parse_cache.get(zip_path)
+    if cached is not None and cached[0] == signature:
+        print(f"File '{filename}' is unchanged since it was last parsed, reusing its DataFrames")
+        return cached[1]
+    commodity_dfs = build_commodity_dfs(zip_path, outputs=outputs)
+    # Only the latest file is kept warm
+    parse_cache.clear()
+    parse_cache[zip_path] = (signature, commodity_dfs)
+    return commodity_dfs
 
-def print_countdown_timer(seconds):
+def save_to_excel(commodity_dfs, excel_file_path, incremental=INCREMENTAL_UPDATE, wb=None):
     """
-    Print a countdown timer.
+    Write the commodity DataFrames into their sheets of the Excel workbook.
 
     Args:
-        seconds (int): Number of seconds for the countdown.
+        commodity_dfs (list): Sheet names and DataFrames formatted by format_lrp_rate_columns.
+        excel_file_path (str): Path to the Excel workbook.
+        incremental (bool): Write only the cells that changed since the previous run.
+        wb (openpyxl.Workbook): Workbook already loaded from excel_file_path, or None to load it.
+
+    Returns:
+        openpyxl.Workbook: The saved workbook, or None if it could not be updated.
     """
-    for remaining in range(seconds, 0, -1):
-        minutes, seconds = divmod(remaining, 60)
-        sys.stdout.write(f"\rCountdown Timer: {minutes}:{seconds:02}")
-        sys.stdout.flush()
-        time.sleep(1)
+    from openpyxl import load_workbook
+    from excel_output import replace_sheet_rows, update_sheet_rows
 
-# Main download and processing loop
-try:
-    if not is_internet_available():
-        raise Exception("Internet connection not available.")
+    try:
+        if wb is None:
+            with stage('excel_load', bytes=os.path.getsize(excel_file_path)):
+                wb = load_workbook(excel_file_path)
+        total_changed_rows = 0
+        for sheet_name, df in commodity_dfs:
+            print(f"Updating Sheet: {sheet_name}")
+            with stage(f"excel_sheet:{sheet_name}", rows=len(df)) as record:
+                if incremental:
+                    # Apply only the inserts, updates and deletes since the previous run
+                    diff = update_sheet_rows(wb, sheet_name, df, DIFF_KEY_COLUMNS)
+                    record.update(diff)
+                    total_changed_rows += diff['inserted'] + diff['updated'] + diff['deleted']
+                    print(f"{sheet_name}: {diff['inserted']} inserted, {diff['updated']} updated, "
+                          f"{diff['deleted']} deleted ({diff['cells_written']} cells written)")
+                else:
+                    # Paste the sorted DataFrame below the header row as whole rows
+                    replace_sheet_rows(wb, sheet_name, df)
+
+        if incremental:
+            print(f"Diff size: {total_changed_rows} rows changed")
+        with stage('excel_save') as record:
+            # Save next to the workbook and swap it in, so a crash never leaves it half-written
+            replace_file(excel_file_path, wb.save)
+            record['bytes'] = os.path.getsize(excel_file_path)
+        print("Excel Workbook saved.")
+        return wb
+    except TypeError as te:
+        if "'NoneType' object is not iterable" in str(te):
+            print("RMA Datapull Empty - Failed to gather Dataframes and update Excel Sheet")
+        else:
+            print(f"An error occurred: {te}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+def regenerate_excel(commodity_dfs, excel_file_path, template_path=WORKBOOK_TEMPLATE_PATH):
+    """
+    Regenerate the Excel workbook from its template and the commodity DataFrames.
 
-    if not is_url_valid(url):
-        raise Exception("URL is not valid or accessible.")
+    Falls back to loading and rewriting the workbook when the template is
+    missing one of the sheets.
 
-    commodity_dfs = []
-    while True:
+    Args:
+        commodity_dfs (list): Sheet names and DataFrames formatted by format_lrp_rate_columns.
+        excel_file_path (str): Path to the Excel workbook.
+        template_path (str): Template workbook, or None to use the workbook itself.
+
+    Returns:
+        bool: True if the workbook was written.
+    """
+    from excel_output import regenerate_workbook, template_sheet_parts
+
+    template_path = template_path or excel_file_path
+    try:
+        if commodity_dfs is None:
+            raise TypeError("'NoneType' object is not iterable")
+        sheet_parts = template_sheet_parts(template_path)
+        missing = [sheet_name for sheet_name, _ in commodity_dfs if sheet_name not in sheet_parts]
+        if missing:
+            print(f"Template '{template_path}' has no sheet named {', '.join(missing)}, rewriting the workbook instead")
+            return save_to_excel(commodity_dfs, excel_file_path, incremental=False) is not None
+        for sheet_name, _ in commodity_dfs:
+            print(f"Updating Sheet: {sheet_name}")
+        with stage('excel_regenerate', sheets=len(commodity_dfs),
+                   rows=sum(len(df) for _, df in commodity_dfs)) as record:
+            record['bytes'] = regenerate_workbook(template_path, excel_file_path, commodity_dfs)
+        print("Excel Workbook saved.")
+        return True
+    except TypeError as te:
+        if "'NoneType' object is not iterable" in str(te):
+            print("RMA Datapull Empty - Failed to gather Dataframes and update Excel Sheet")
+        else:
+            print(f"An error occurred: {te}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+    return False
+
+def parse_args(argv=None):
+    """
+    Parse the command line.
+
+    Args:
+        argv (list): Arguments to parse, or None for sys.argv.
+
+    Returns:
+        argparse.Namespace: Parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Update the LRP quote workbook from the RMA ADM daily file.")
+    parser.add_argument("--date", help="Date of the ADM daily file (YYYYMMDD, default: today)")
+    parser.add_argument("--states", nargs="+", default=TARGET_STATE_CODES, help="State codes to build sheets for")
+    parser.add_argument("--commodities", nargs="+", help="Commodity codes to build sheets for (default: all)")
+    parser.add_argument("--workbook", default=EXCEL_FILE_PATH, help="Excel workbook to update")
+    parser.add_argument("--no-workbook", action="store_true", help="Do not update the Excel workbook")
+    parser.add_argument("--store-directory", default=QUOTE_STORE_DIRECTORY, help="Root directory of the quote store")
+    parser.add_argument("--no-store", action="store_true", help="Do not append to the quote store")
+    parser.add_argument("--outputs", nargs="+", default=OUTPUT_TARGETS,
+                        choices=['commodity_workbooks', 'csv', 'html', 'pdf'],
+                        help="Extra outputs to write alongside the workbook")
+    parser.add_argument("--output-directory", default=OUTPUT_DIRECTORY, help="Directory the extra outputs go to")
+    parser.add_argument("--template", default=WORKBOOK_TEMPLATE_PATH,
+                        help="Workbook to regenerate the workbook from (default: the workbook itself)")
+    update_mode = parser.add_mutually_exclusive_group()
+    update_mode.add_argument("--incremental", dest="incremental", action="store_true", default=INCREMENTAL_UPDATE,
+                             help="Load the workbook and write only the cells that changed")
+    update_mode.add_argument("--full-rewrite", dest="incremental", action="store_false",
+                             help="Regenerate the workbook from its template")
+    parser.add_argument("--no-wait", action="store_true", help="Do not wait for the file to be published")
+    parser.add_argument("--profile", action="store_true", default=PROFILE_RUN, help="Dump a cProfile of each run")
+    parser.add_argument("--daemon", action="store_true", help="Stay resident and run once a day at --at")
+    parser.add_argument("--at", default=DAEMON_RUN_TIME, help="Daily run time in daemon mode (HH:MM)")
+    parser.add_argument("--dev", action="store_true", help="Prompt for an overwrite date, as in dev mode")
+    parser.add_argument("--probe", action="store_true",
+                        help="Only check whether the file is published; exit 0 if it is, 1 if not, "
+                             f"{PROBE_UNREACHABLE_EXIT_CODE} if the server cannot be reached")
+    args = parser.parse_args(argv)
+
+    unknown_commodities = set(args.commodities or []) - set(NEW_COMMODITY_DIRECTORY)
+    if unknown_commodities:
+        parser.error(f"unknown or disabled commodity codes: {', '.join(sorted(unknown_commodities))}")
+    try:
+        check_written_sheet_names(NEW_COMMODITY_DIRECTORY, args.states, TARGET_STATE_CODE, "--states")
+    except ValueError as e:
+        parser.error(str(e))
+    if args.date:
         try:
-            commodity_dfs = download_and_extract_file(url, SAVE_DIRECTORY, MAX_RETRIES)
-            if commodity_dfs:
-                print(f"Number of DataFrames processed: {len(commodity_dfs)}")
-                break
-            else:
+            if len(args.date) != 8:
+                raise ValueError(args.date)
+            datetime.datetime.strptime(args.date, "%Y%m%d")
+        except ValueError:
+            parser.error(f"--date must be YYYYMMDD, got '{args.date}'")
+    try:
+        args.at = datetime.datetime.strptime(args.at, "%H:%M").time()
+    except ValueError:
+        parser.error(f"--at must be HH:MM, got '{args.at}'")
+    if args.daemon and (args.date or args.dev):
+        parser.error("--daemon always runs for the current date")
+    if args.daemon and args.probe:
+        parser.error("--probe cannot be combined with --daemon")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Developer mode setting
+    overwrite_date = args.date
+    if args.dev:
+        overwrite_date = input("Enter the OVERWRITE_DATE (YYYYMMDD format), or press Enter to use the default: ")
+    current_date_str = datetime.datetime.now().strftime("%Y%m%d") if not overwrite_date else overwrite_date
+
+    if args.probe:
+        # Answer with a single HEAD request, before anything heavy is imported
+        url = build_url(current_date_str)
+        try:
+            published = is_url_published(url, timeout=PROBE_TIMEOUT_SECONDS)
+        except OSError as e:
+            print(f"Could not check '{os.path.basename(url)}': {e}")
+            return PROBE_UNREACHABLE_EXIT_CODE
+        print(f"File '{os.path.basename(url)}' is {'published' if published else 'not published yet'}")
+        return 0 if published else 1
+
+    run_options = {
+        'profile': args.profile,
+        'outputs': output_matrix(args.states, args.commodities),
+        'excel_file_path': None if args.no_workbook else args.workbook,
+        'store_directory': None if args.no_store else args.store_directory,
+        'incremental': args.incremental,
+        'workbook_template_path': args.template,
+        'wait': not args.no_wait,
+        'output_targets': args.outputs,
+        'output_directory': args.output_directory,
+    }
+    if args.daemon:
+        run_daemon(args.at, **run_options)
+        return 0
+
+    return 0 if run(current_date_str, **run_options) else 1
+
+# Next datetime at the given time of day, strictly after now
+def next_run_at(run_time, now):
+    run_at = datetime.datetime.combine(now.date(), run_time)
+    return run_at if run_at > now else run_at + datetime.timedelta(days=1)
+
+def run_daemon(run_time, **run_options):
+    """
+    Stay resident and run the pipeline for the current date once a day.
+
+    The first run starts immediately. The last parsed file is kept between
+    runs, so a run skips re-parsing a file that has not changed. In
+    incremental mode the loaded workbook is kept as well, and reloaded only
+    if it was modified on disk since the last run saved it.
+
+    Args:
+        run_time (datetime.time): Time of day to run at.
+        **run_options: Keyword arguments passed to run().
+    """
+    warm = {'parse_cache': {}}
+    try:
+        while True:
+            run(datetime.datetime.now().strftime("%Y%m%d"), warm=warm, **run_options)
+            run_at = next_run_at(run_time, datetime.datetime.now())
+            print(f"Next run at {run_at.strftime('%Y-%m-%d %H:%M')}")
+            time.sleep(max((run_at - datetime.datetime.now()).total_seconds(), 0))
+    except KeyboardInterrupt:
+        print('Daemon stopped by user.')
+
+def run(current_date_str, profile=False, outputs=None, excel_file_path=EXCEL_FILE_PATH,
+        store_directory=QUOTE_STORE_DIRECTORY, incremental=INCREMENTAL_UPDATE, wait=True, warm=None,
+        output_targets=OUTPUT_TARGETS, output_directory=OUTPUT_DIRECTORY,
+        workbook_template_path=WORKBOOK_TEMPLATE_PATH):
+    """
+    Run the full pipeline for one date and write its run report.
+
+    Args:
+        current_date_str (str): Date of the ADM daily file (YYYYMMDD).
+        profile (bool): Also dump a cProfile of the run next to the report.
+        outputs (list): Outputs from output_matrix to build, or None for every configured output.
+        excel_file_path (str): Excel workbook to update, or None to skip it.
+        store_directory (str): Root directory of the quote store, or None to skip it.
+        incremental (bool): Write only the cells that changed since the previous run,
+            instead of regenerating the workbook from its template.
+        wait (bool): Wait for the file to be published before downloading it.
+        warm (dict): State kept between daemon runs, or None for a one-off run.
+        output_targets (list): Extra outputs from output_writers.OUTPUT_WRITERS to write alongside the workbook.
+        output_directory (str): Directory the extra outputs are written to.
+        workbook_template_path (str): Template the workbook is regenerated from, or None for the workbook itself.
+
+    Returns:
+        bool: True if the day's data was pulled and stored and every output was written.
+    """
+    # URL construction
+    url = build_url(current_date_str)
+    filename = os.path.basename(url)
+    print(f"Gathering RMA Data for Date: {current_date_str}")
+    print(f"Gathering RMA Data from URL: {url}")
+
+    run_report = start_run(date=current_date_str, url=url)
+    profile_path = None
+    if profile:
+        stamp = datetime.datetime.fromisoformat(run_report['started_at']).strftime("%Y%m%d_%H%M%S")
+        profile_path = os.path.join(REPORT_DIRECTORY, f"run_{stamp}.prof")
+
+    with profiled(profile_path):
+        # Wait for publication, then download and process
+        commodity_dfs = None
+        stored = False
+        try:
+            if not is_internet_available(url):
+                raise Exception("Internet connection not available.")
+
+            # A file already in the download cache was published, and its conditional GET checks it is current
+            if wait and load_cache_index(SAVE_DIRECTORY).get(url) is None:
+                with stage('wait_for_publication'):
+                    published = wait_for_publication(url, PUBLICATION_DEADLINE_SECONDS)
+                if not published:
+                    raise Exception(f"File '{filename}' was not published within "
+                                    f"{PUBLICATION_DEADLINE_SECONDS // 60} minutes.")
+
+            parse_cache = warm['parse_cache'] if warm is not None else None
+            commodity_dfs = download_and_extract_file(url, SAVE_DIRECTORY, MAX_RETRIES, outputs, parse_cache)
+            if not commodity_dfs:
                 raise Exception("No data was downloaded.")
-        except Exception as e:
-            print(f"No Data Pulled for {datetime.datetime.now().strftime('%Y-%m-%d at %H:%M:%S')}")
-            print('\nRestarting Program - Press "Ctrl+C" to exit the program if needed.')
-            print_countdown_timer(300)  # 5-minute countdown
+            print(f"Number of DataFrames processed: {len(commodity_dfs)}")
+
+            # Append the day's quotes to the columnar quote store
+            if store_directory:
+                from quote_store import append_quotes
+
+                with stage('store') as record:
+                    row_count = append_quotes(store_directory, current_date_str,
+                                              sheet_partition_dfs(commodity_dfs, outputs))
+                    record['rows'] = row_count
+                print(f"Stored {row_count} quote rows in '{store_directory}'")
+            stored = True
         except KeyboardInterrupt:
             print('Program terminated by user.')
-except Exception as e:
-    print(f"An error occurred: {e}")
-# Saving to Excel file
-try:
-    wb = load_workbook(EXCEL_FILE_PATH)
-    for sheet_name, df in commodity_dfs:
-        print(f"Updating Sheet: {sheet_name}")
-        sheet = wb[sheet_name] if sheet_name in wb.sheetnames else wb.create_sheet(title=sheet_name)
-        sheet.delete_rows(2, sheet.max_row)
-
-        def calculate_new_column_value(row):
-            feed_value = pd.to_numeric(row[8], errors='coerce')  # Assuming feed value is in column 8
-            condition_value = pd.to_numeric(row[10], errors='coerce')  # Assuming condition value is in column 10
-            if 0.95 <= feed_value <= 1.00:
-                return condition_value * (1 - 0.35)
-            elif 0.90 <= feed_value <= 0.9499:
-                return condition_value * (1 - 0.40)
-            elif 0.85 <= feed_value <= 0.8999:
-                return condition_value * (1 - 0.45)
-            elif 0.80 <= feed_value <= 0.8499:
-                return condition_value * (1 - 0.50)
-            elif 0.70 <= feed_value <= 0.7999:
-                return condition_value * (1 - 0.55)
-            else:
-                return 0.0  # Default value when none of the conditions are met
-
-
-        # Apply the custom function to create the 'NewColumn'
-        df['NewColumn'] = df.apply(calculate_new_column_value, axis=1)
-        print(f"Updated Producer Premium for: {sheet_name}")
-
-        # Iterate through the sorted DataFrame and paste data into the Excel sheet
-        for index, row in df.iterrows():
-            for col_idx, value in enumerate(row, 1):
-                # Start pasting at row 2 (skip the header row)
-                cell = sheet.cell(row=index + 2, column=col_idx)
-                cell.value = value
-
-    wb.save(EXCEL_FILE_PATH)
-    print("Excel Workbook saved.")
-except TypeError as te:
-    if "'NoneType' object is not iterable" in str(te):
-        print("RMA Datapull Empty - Failed to gather Dataframes and update Excel Sheet")
-    else:
-        print(f"An error occurred: {te}")
-except Exception as e:
-    print(f"An error occurred: {e}")
-# Save the changes to the Excel file
+        except Exception as e:
+            print(f"No Data Pulled for {datetime.datetime.now().strftime('%Y-%m-%d at %H:%M:%S')}")
+            print(f"An error occurred: {e}")
+
+        # Sheets hold the values as RMA publishes them: format them once, then write every
+        # output from the same DataFrames concurrently
+        sheet_dfs = None
+        if commodity_dfs and (excel_file_path or output_targets):
+            from lrp_rate import format_lrp_rate_columns
+
+            with stage('format', sheets=len(commodity_dfs)):
+                sheet_dfs = [(sheet_name, format_lrp_rate_columns(df)) for sheet_name, df in commodity_dfs]
+
+        writers = {}
+        if excel_file_path:
+            def save_workbook():
+                if not incremental:
+                    if warm is not None:
+                        warm['workbook'] = None
+                    written = regenerate_excel(sheet_dfs, excel_file_path, workbook_template_path)
+                    return excel_file_path if written else None
+                wb = None
+                if (warm is not None and os.path.exists(excel_file_path)
+                        and warm.get('workbook_mtime') == os.path.getmtime(excel_file_path)):
+                    wb = warm['workbook']
+                wb = save_to_excel(sheet_dfs, excel_file_path, incremental, wb)
+                if warm is not None:
+                    warm['workbook'] = wb
+                    warm['workbook_mtime'] = os.path.getmtime(excel_file_path) if wb is not None else None
+                return excel_file_path if wb is not None else None
+            writers['workbook'] = save_workbook
+        if sheet_dfs and output_targets:
+            from output_writers import OUTPUT_WRITERS
+
+            sheet_groups = {
+                sheet_name: NEW_COMMODITY_DIRECTORY[key]['directory_name']
+                for key, state_code, sub_key, sheet_name in (outputs or output_matrix())
+            }
+            for target in output_targets:
+                writers[target] = functools.partial(OUTPUT_WRITERS[target], sheet_dfs, output_directory,
+                                                    current_date_str, sheet_groups)
+        # Writers report failures by returning None
+        failed_outputs = []
+        if writers:
+            from output_writers import run_writers
+
+            for target, paths in run_writers(writers).items():
+                if paths is None:
+                    failed_outputs.append(target)
+                elif target != 'workbook' and paths:
+                    print(f"Wrote {target}: {', '.join(paths)}")
+            if failed_outputs:
+                print(f"Outputs not written: {', '.join(failed_outputs)}")
+
+        # Keep the download directory and the archive within their budgets
+        try:
+            from archive import prune
+
+            with stage('archive_prune') as record:
+                record.update(prune(ARCHIVE_DIRECTORY, SAVE_DIRECTORY))
+        except Exception as e:
+            print(f"An error occurred: {e}")
+
+    run_report['failed_outputs'] = failed_outputs
+    report_path = write_run_report(REPORT_DIRECTORY)
+    print(f"Run report written to '{report_path}'")
+    if profile_path:
+        print(f"Profile written to '{profile_path}'")
+    return stored and not failed_outputs
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
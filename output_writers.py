@@ -0,0 +1,166 @@
+import html
+import os
+from concurrent.futures import ThreadPoolExecutor
+from atomic_file import replace_file
+from instrumentation import stage
+
+# Columns added to the combined CSV so rows can be traced back to their sheet
+CSV_SHEET_COLUMN = 'Sheet'
+
+
+def write_commodity_workbooks(sheet_dfs, output_directory, date_str, sheet_groups):
+    """
+    Write one workbook per commodity group, with a sheet per configured sheet.
+
+    Args:
+        sheet_dfs (list): Sheet names and DataFrames formatted for output.
+        output_directory (str): Directory the files are written to.
+        date_str (str): Date of the ADM daily file (YYYYMMDD).
+        sheet_groups (dict): Sheet name to the commodity group (workbook) it belongs in.
+
+    Returns:
+        list: Paths of the written workbooks.
+    """
+    from openpyxl import Workbook
+
+    grouped = {}
+    for sheet_name, df in sheet_dfs:
+        grouped.setdefault(sheet_groups[sheet_name], []).append((sheet_name, df))
+
+    paths = []
+    for group, group_dfs in grouped.items():
+        wb = Workbook(write_only=True)
+        for sheet_name, df in group_dfs:
+            sheet = wb.create_sheet(title=sheet_name)
+            sheet.append(list(df.columns))
+            for row in df.itertuples(index=False, name=None):
+                sheet.append(row)
+        paths.append(replace_file(os.path.join(output_directory, f"LRP_{group}_{date_str}.xlsx"), wb.save))
+    return paths
+
+
+def write_csv(sheet_dfs, output_directory, date_str, sheet_groups):
+    """
+    Write every sheet into one CSV, with a column naming the sheet of each row.
+
+    Args:
+        sheet_dfs (list): Sheet names and DataFrames formatted for output.
+        output_directory (str): Directory the file is written to.
+        date_str (str): Date of the ADM daily file (YYYYMMDD).
+        sheet_groups (dict): Sheet name to commodity group; unused.
+
+    Returns:
+        list: Path of the written CSV.
+    """
+    import pandas as pd
+
+    df = pd.concat([df.assign(**{CSV_SHEET_COLUMN: sheet_name}) for sheet_name, df in sheet_dfs], ignore_index=True)
+    df = df[[CSV_SHEET_COLUMN] + [column for column in df.columns if column != CSV_SHEET_COLUMN]]
+    path = os.path.join(output_directory, f"quotes_{date_str}.csv")
+    return [replace_file(path, lambda temp_path: df.to_csv(temp_path, index=False))]
+
+
+def quote_sheet_html(sheet_dfs, date_str):
+    """
+    Render every sheet as an HTML quote sheet.
+
+    Args:
+        sheet_dfs (list): Sheet names and DataFrames formatted for output.
+        date_str (str): Date of the ADM daily file (YYYYMMDD).
+
+    Returns:
+        str: The HTML document.
+    """
+    title = f"LRP Quotes {date_str}"
+    sections = [
+        f"<h2>{html.escape(sheet_name)}</h2>\n{df.to_html(index=False, border=0, classes='quotes')}"
+        for sheet_name, df in sheet_dfs
+    ]
+    return "\n".join([
+        "<!DOCTYPE html>",
+        f"<html><head><meta charset=\"utf-8\"><title>{html.escape(title)}</title>",
+        "<style>body{font-family:sans-serif}table.quotes{border-collapse:collapse;font-size:11px}"
+        "table.quotes td,table.quotes th{border:1px solid #ccc;padding:2px 6px;text-align:right}</style>",
+        f"</head><body><h1>{html.escape(title)}</h1>",
+        *sections,
+        "</body></html>",
+    ])
+
+
+def write_html(sheet_dfs, output_directory, date_str, sheet_groups):
+    """
+    Write the HTML quote sheet.
+
+    Args:
+        sheet_dfs (list): Sheet names and DataFrames formatted for output.
+        output_directory (str): Directory the file is written to.
+        date_str (str): Date of the ADM daily file (YYYYMMDD).
+        sheet_groups (dict): Sheet name to commodity group; unused.
+
+    Returns:
+        list: Path of the written HTML file.
+    """
+    document = quote_sheet_html(sheet_dfs, date_str)
+
+    def write(temp_path):
+        with open(temp_path, 'w', encoding='utf-8') as html_file:
+            html_file.write(document)
+    return [replace_file(os.path.join(output_directory, f"quotes_{date_str}.html"), write)]
+
+
+def write_pdf(sheet_dfs, output_directory, date_str, sheet_groups):
+    """
+    Write the quote sheet as a PDF. Needs the optional pdfkit package and wkhtmltopdf.
+
+    Args:
+        sheet_dfs (list): Sheet names and DataFrames formatted for output.
+        output_directory (str): Directory the file is written to.
+        date_str (str): Date of the ADM daily file (YYYYMMDD).
+        sheet_groups (dict): Sheet name to commodity group; unused.
+
+    Returns:
+        list: Path of the written PDF.
+    """
+    try:
+        import pdfkit
+    except ImportError:
+        raise Exception("PDF output needs the pdfkit package (and wkhtmltopdf) to be installed.")
+    document = quote_sheet_html(sheet_dfs, date_str)
+    path = os.path.join(output_directory, f"quotes_{date_str}.pdf")
+    return [replace_file(path, lambda temp_path: pdfkit.from_string(document, temp_path))]
+
+
+# Output targets that can be written alongside the main workbook
+OUTPUT_WRITERS = {
+    'commodity_workbooks': write_commodity_workbooks,
+    'csv': write_csv,
+    'html': write_html,
+    'pdf': write_pdf,
+}
+
+
+def run_writers(writers):
+    """
+    Run output writers concurrently, each in its own thread and stage.
+
+    A writer that fails is reported and does not stop the others.
+
+    Args:
+        writers (dict): Output name to a callable taking no arguments.
+
+    Returns:
+        dict: Output name to the writer's result, or None if it failed.
+    """
+    def run_writer(name, writer):
+        try:
+            with stage(f"output:{name}"):
+                return writer()
+        except Exception as e:
+            print(f"An error occurred writing {name}: {e}")
+            return None
+
+    if not writers:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(writers)) as pool:
+        futures = {name: pool.submit(run_writer, name, writer) for name, writer in writers.items()}
+        return {name: future.result() for name, future in futures.items()}
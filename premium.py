@@ -0,0 +1,49 @@
+import numpy as np
+
+# Default subsidy schedule as (lowest coverage level, subsidy rate) bands in ascending order.
+# Each band runs up to the next band's lower bound; the last band runs up to MAX_COVERAGE_LEVEL.
+DEFAULT_SUBSIDY_BANDS = (
+    (0.70, 0.55),
+    (0.80, 0.50),
+    (0.85, 0.45),
+    (0.90, 0.40),
+    (0.95, 0.35),
+)
+MAX_COVERAGE_LEVEL = 1.00
+
+
+def subsidy_rates(coverage_levels, subsidy_bands=DEFAULT_SUBSIDY_BANDS):
+    """
+    Look up the subsidy rate for each coverage level with a single bin search.
+
+    Args:
+        coverage_levels (array-like): Livestock coverage level percents (0-1).
+        subsidy_bands (tuple): (lowest coverage level, subsidy rate) bands in ascending order.
+
+    Returns:
+        numpy.ndarray: Subsidy rate per coverage level, NaN where no band applies.
+    """
+    levels = np.asarray(coverage_levels, dtype=float)
+    lower_bounds = np.array([lower_bound for lower_bound, _ in subsidy_bands], dtype=float)
+    rates = np.array([rate for _, rate in subsidy_bands], dtype=float)
+
+    band_index = np.searchsorted(lower_bounds, levels, side='right') - 1
+    in_band = (band_index >= 0) & (levels <= MAX_COVERAGE_LEVEL)
+    return np.where(in_band, rates[band_index.clip(0)], np.nan)
+
+
+def producer_premium(coverage_levels, costs_per_cwt, subsidy_bands=DEFAULT_SUBSIDY_BANDS):
+    """
+    Calculate the subsidized producer premium per cwt for whole columns at once.
+
+    Args:
+        coverage_levels (array-like): Livestock coverage level percents (0-1).
+        costs_per_cwt (array-like): Cost per cwt amounts.
+        subsidy_bands (tuple): (lowest coverage level, subsidy rate) bands in ascending order.
+
+    Returns:
+        numpy.ndarray: Producer premium per cwt, 0.0 where no subsidy band applies.
+    """
+    rates = subsidy_rates(coverage_levels, subsidy_bands)
+    costs = np.asarray(costs_per_cwt, dtype=float)
+    return np.where(np.isnan(rates), 0.0, costs * (1 - rates))
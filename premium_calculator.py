@@ -0,0 +1,171 @@
+import argparse
+import datetime
+import numpy as np
+import pandas as pd
+from lrp_rate import published_values
+from main import NEW_COMMODITY_DIRECTORY, QUOTE_STORE_DIRECTORY, TARGET_STATE_CODE
+from premium import DEFAULT_SUBSIDY_BANDS, subsidy_rates
+from quote_index import sheet_frames, stored_frames
+
+# Columns of the rate table, from the sheet and store columns they are read from
+RATE_COLUMNS = {
+    'endorsement_length': 'Endorsement Length Count',
+    'coverage_price': 'Coverage Price',
+    'coverage_level': 'Livestock Coverage Level Percent',
+    'cost_per_cwt': 'Cost Per Cwt Amount',
+    'target_low_weight': 'Target Low Weight',
+    'target_high_weight': 'Target High Weight',
+}
+# Columns identifying the quotes a scenario can be priced from
+RATE_KEY_COLUMNS = ['commodity_code', 'type_code', 'state_code', 'endorsement_length']
+# Columns every scenario needs; it also needs a coverage_price or a coverage_level to match on
+SCENARIO_COLUMNS = ['commodity_code', 'type_code', 'endorsement_length', 'head_count', 'target_weight']
+
+
+def frame_rates(df, commodity_code, type_code, state_code):
+    """
+    Take the rate table columns of one sheet or store partition.
+
+    Args:
+        df (pandas.DataFrame): Typed sheet DataFrame or stored quotes.
+        commodity_code (str): Commodity code.
+        type_code (str): Type code.
+        state_code (str): State code, used when the frame has no 'State Code' column.
+
+    Returns:
+        pandas.DataFrame: Rates of the frame, with the commodity's subsidy rate per row.
+    """
+    rates = pd.DataFrame({name: published_values(df, column) for name, column in RATE_COLUMNS.items()})
+    rates['endorsement_length'] = rates['endorsement_length'].astype('int64')
+    rates.insert(0, 'commodity_code', commodity_code)
+    rates.insert(1, 'type_code', type_code)
+    rates.insert(2, 'state_code', df['State Code'].astype(str).to_numpy() if 'State Code' in df.columns
+                 else state_code)
+    subsidy_bands = NEW_COMMODITY_DIRECTORY.get(commodity_code, {}).get('subsidy_bands', DEFAULT_SUBSIDY_BANDS)
+    rates['subsidy_rate'] = np.nan_to_num(subsidy_rates(rates['coverage_level'], subsidy_bands))
+    return rates
+
+
+def build_rate_table(commodity_dfs, outputs=None):
+    """
+    Combine the sheet DataFrames of a run into one rate table.
+
+    Args:
+        commodity_dfs (list): List of tuples containing sheet names and corresponding DataFrames.
+        outputs (list): Outputs from output_matrix the DataFrames were built for, or None for every configured output.
+
+    Returns:
+        pandas.DataFrame: Rate table for quote_scenarios.
+    """
+    tables = [frame_rates(df, *codes) for *codes, df in sheet_frames(commodity_dfs, outputs)]
+    return pd.concat(tables, ignore_index=True)
+
+
+def load_rate_table(store_directory, sales_effective_date=None):
+    """
+    Build the rate table of one day of the quote store.
+
+    Args:
+        store_directory (str): Root directory of the quote store.
+        sales_effective_date (datetime.date): Day to load, or None for the latest stored day.
+
+    Returns:
+        pandas.DataFrame: Rate table for quote_scenarios, empty if the store holds no quotes.
+    """
+    tables = [frame_rates(df, *codes) for *codes, df in stored_frames(store_directory, sales_effective_date)]
+    if not tables:
+        return frame_rates(pd.DataFrame(columns=list(RATE_COLUMNS.values())), '', '', '')
+    return pd.concat(tables, ignore_index=True)
+
+
+def quote_scenarios(rate_table, scenarios):
+    """
+    Price a batch of lots in one pass over the rate table.
+
+    Each scenario is matched to the quote of its commodity, type, state and
+    endorsement length with the nearest coverage price (or coverage level,
+    if the scenario gives a coverage_level instead). Then, per lot:
+    insured cwt = head count x target weight x insured share,
+    liability = coverage price x insured cwt,
+    total premium = cost per cwt x insured cwt,
+    subsidy = total premium x subsidy rate,
+    producer premium = total premium - subsidy.
+
+    Args:
+        rate_table (pandas.DataFrame): Rates from build_rate_table or load_rate_table.
+        scenarios (pandas.DataFrame): One row per lot with commodity_code, type_code, endorsement_length,
+            head_count, target_weight (cwt per head) and coverage_price or coverage_level; optionally
+            insured_share (default 1) and state_code (default TARGET_STATE_CODE).
+
+    Returns:
+        pandas.DataFrame: The scenarios in their original order with the matched quote and the
+            insured_cwt, liability, total_premium, subsidy and producer_premium of each lot. Lots
+            without a matching quote get NaN; weight_in_range flags target weights the type covers.
+            Scenario columns named like rate table columns are returned as requested_<column>.
+    """
+    missing = [column for column in SCENARIO_COLUMNS if column not in scenarios.columns]
+    if 'coverage_price' not in scenarios.columns and 'coverage_level' not in scenarios.columns:
+        missing.append('coverage_price or coverage_level')
+    if missing:
+        raise ValueError(f"Scenarios are missing columns: {', '.join(missing)}")
+    match_on = 'coverage_price' if 'coverage_price' in scenarios.columns else 'coverage_level'
+
+    lots = scenarios.copy()
+    if 'state_code' not in lots.columns:
+        lots['state_code'] = TARGET_STATE_CODE
+    if 'insured_share' not in lots.columns:
+        lots['insured_share'] = 1.0
+    for column in ('commodity_code', 'type_code', 'state_code'):
+        lots[column] = lots[column].astype(str)
+    lots['endorsement_length'] = lots['endorsement_length'].astype('int64')
+    lots[match_on] = lots[match_on].astype('float64')
+    lots['_order'] = np.arange(len(lots))
+
+    # Scenario columns the rate table also has, such as a coverage level given next to the coverage price
+    # matched on, are kept as requested_<column> so the matched quote's columns keep their names
+    lots = lots.rename(columns={
+        column: f"requested_{column}" for column in rate_table.columns
+        if column in lots.columns and column not in RATE_KEY_COLUMNS
+    })
+
+    # Nearest quote of the same group, for every lot at once
+    lots['_match'] = lots[f"requested_{match_on}"]
+    quotes = rate_table.assign(_match=rate_table[match_on]).sort_values('_match', kind='stable')
+    matched = pd.merge_asof(
+        lots.sort_values('_match', kind='stable'), quotes, on='_match', by=RATE_KEY_COLUMNS, direction='nearest',
+    ).sort_values('_order').drop(columns=['_match', '_order']).reset_index(drop=True)
+
+    target_weight = matched['target_weight'].to_numpy(dtype='float64')
+    insured_cwt = (matched['head_count'].to_numpy(dtype='float64') * target_weight
+                   * matched['insured_share'].to_numpy(dtype='float64'))
+    total_premium = matched['cost_per_cwt'].to_numpy(dtype='float64') * insured_cwt
+    subsidy = total_premium * matched['subsidy_rate'].to_numpy(dtype='float64')
+    matched['weight_in_range'] = ((target_weight >= matched['target_low_weight'].to_numpy(dtype='float64'))
+                                  & (target_weight <= matched['target_high_weight'].to_numpy(dtype='float64')))
+    matched['insured_cwt'] = insured_cwt
+    matched['liability'] = matched['coverage_price'].to_numpy(dtype='float64') * insured_cwt
+    matched['total_premium'] = total_premium
+    matched['subsidy'] = subsidy
+    matched['producer_premium'] = total_premium - subsidy
+    return matched
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Price a batch of LRP lots from the quote store.")
+    parser.add_argument("scenarios", help="CSV of lots: commodity_code, type_code, endorsement_length, head_count, "
+                                          "target_weight, coverage_price or coverage_level, [insured_share], "
+                                          "[state_code]")
+    parser.add_argument("--output", help="CSV to write the priced lots to (default: print them)")
+    parser.add_argument("--date", help="Sales effective date (YYYYMMDD, default: latest stored)")
+    parser.add_argument("--store-directory", default=QUOTE_STORE_DIRECTORY, help="Root directory of the quote store")
+    args = parser.parse_args()
+
+    sales_effective_date = datetime.datetime.strptime(args.date, "%Y%m%d").date() if args.date else None
+    rate_table = load_rate_table(args.store_directory, sales_effective_date)
+    scenarios = pd.read_csv(args.scenarios, dtype={'commodity_code': str, 'type_code': str, 'state_code': str})
+    priced = quote_scenarios(rate_table, scenarios)
+    if args.output:
+        priced.to_csv(args.output, index=False)
+        print(f"Priced {len(priced)} lots into '{args.output}'")
+    else:
+        print(priced.to_string(index=False))
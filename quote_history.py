@@ -0,0 +1,208 @@
+import argparse
+import datetime
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from main import QUOTE_STORE_DIRECTORY
+from lrp_rate import published_values
+from quote_store import load_quotes
+
+# One contract followed across days. RMA quotes fixed coverage prices while the
+# coverage level moves with the expected ending value, so the price identifies it
+ContractKey = namedtuple('ContractKey', [
+    'commodity_code', 'type_code', 'state_code', 'endorsement_length', 'coverage_price',
+])
+
+# Stored columns kept as daily series
+HISTORY_FIELDS = (
+    'Expected Ending Value Amount', 'Livestock Coverage Level Percent', 'Livestock Rate', 'Cost Per Cwt Amount',
+)
+TREND_DAYS = 30
+
+
+class QuoteHistory:
+    """
+    Daily series of every contract, held as one dense array per field.
+
+    Each field is a (contracts x days) float32 array with NaN where a
+    contract was not quoted, so trends over any window are computed for all
+    contracts at once with array operations.
+    """
+
+    def __init__(self, keys, dates, values):
+        self.keys = keys
+        self.dates = dates
+        self.values = values
+        self._positions = {key: position for position, key in enumerate(keys)}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def series(self, key, field='Cost Per Cwt Amount'):
+        """
+        Get the daily values of one contract.
+
+        Args:
+            key (ContractKey): Contract to look up.
+            field (str): One of HISTORY_FIELDS.
+
+        Returns:
+            pandas.Series: Values indexed by sales effective date, only on days the contract was quoted.
+        """
+        position = self._positions.get(key)
+        if position is None:
+            return pd.Series(dtype='float64', name=field)
+        series = pd.Series(self.values[field][position], index=pd.DatetimeIndex(self.dates), name=field)
+        return series.dropna().astype('float64')
+
+    def window(self, days, as_of=None):
+        """
+        Find the columns of the days in a trailing window.
+
+        Args:
+            days (int): Calendar days in the window, ending on as_of.
+            as_of (datetime.date): Last day of the window, or None for the latest day held.
+
+        Returns:
+            slice: Columns of the window in the value arrays.
+        """
+        as_of = np.datetime64(as_of, 'D') if as_of is not None else self.dates[-1]
+        start = np.searchsorted(self.dates, as_of - np.timedelta64(days - 1, 'D'), side='left')
+        stop = np.searchsorted(self.dates, as_of, side='right')
+        return slice(start, stop)
+
+    def trend(self, field='Cost Per Cwt Amount', days=TREND_DAYS, as_of=None):
+        """
+        Summarize every contract's trend over a trailing window.
+
+        Args:
+            field (str): One of HISTORY_FIELDS.
+            days (int): Calendar days in the window, ending on as_of.
+            as_of (datetime.date): Last day of the window, or None for the latest day held.
+
+        Returns:
+            pandas.DataFrame: One row per contract quoted in the window, with its number of
+                observations, first, last and mean value, change, and least-squares slope per day.
+        """
+        columns = self.window(days, as_of) if len(self.dates) else slice(0, 0)
+        window = self.values[field][:, columns].astype('float64')
+        offsets = (self.dates[columns] - self.dates[columns][:1]).astype('float64')
+
+        quoted = ~np.isnan(window)
+        observations = quoted.sum(axis=1)
+        rows = np.arange(len(window))
+        first = window[rows, quoted.argmax(axis=1)] if window.shape[1] else np.full(len(window), np.nan)
+        last = window[rows, window.shape[1] - 1 - quoted[:, ::-1].argmax(axis=1)] if window.shape[1] else first
+
+        # Least-squares fit of value against day offset, over the quoted days only
+        x = np.where(quoted, offsets, 0.0)
+        y = np.where(quoted, window, 0.0)
+        sum_x, sum_y = x.sum(axis=1), y.sum(axis=1)
+        denominator = observations * (x * x).sum(axis=1) - sum_x ** 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = np.where(denominator > 0, (observations * (x * y).sum(axis=1) - sum_x * sum_y) / denominator,
+                             np.nan)
+            mean = sum_y / observations
+
+        df = pd.DataFrame(self.keys, columns=ContractKey._fields)
+        df['observations'] = observations
+        df['first'] = first
+        df['last'] = last
+        df['change'] = last - first
+        df['mean'] = mean
+        df['slope_per_day'] = slope
+        return df[observations > 0].reset_index(drop=True)
+
+
+def build_quote_history(df):
+    """
+    Arrange stored quotes into per-contract daily series.
+
+    Quotes are grouped by commodity, type, state, endorsement length and
+    coverage price, rounded to the decimals RMA publishes. A file holds one
+    quote per contract and day; should a repeated quote ever appear, the
+    first is kept and the number left out is reported.
+
+    Args:
+        df (pandas.DataFrame): Quotes from quote_store.load_quotes.
+
+    Returns:
+        QuoteHistory: The series.
+    """
+    key_df = pd.DataFrame({
+        'commodity_code': df['commodity_code'].astype(str).to_numpy(),
+        'type_code': df['type_code'].astype(str).to_numpy(),
+        'state_code': df['State Code'].astype(str).to_numpy(),
+        'endorsement_length': df['Endorsement Length Count'].to_numpy(dtype='int64'),
+        'coverage_price': published_values(df, 'Coverage Price'),
+        'date': pd.to_datetime(df['sales_effective_date']).to_numpy().astype('datetime64[D]'),
+    })
+    repeated = key_df.duplicated().to_numpy()
+    if repeated.any():
+        print(f"Warning: left out {int(repeated.sum())} repeated quotes of a contract on the same day")
+    kept = np.flatnonzero(~repeated)
+    key_df = key_df.iloc[kept]
+
+    key_codes, unique_keys = pd.factorize(pd.MultiIndex.from_frame(key_df[list(ContractKey._fields)]), sort=True)
+    date_codes, unique_dates = pd.factorize(key_df['date'].to_numpy(), sort=True)
+
+    values = {}
+    for field in HISTORY_FIELDS:
+        array = np.full((len(unique_keys), len(unique_dates)), np.nan, dtype='float32')
+        array[key_codes, date_codes] = df[field].to_numpy(dtype='float32')[kept]
+        values[field] = array
+    keys = [
+        ContractKey(commodity_code, type_code, state_code, int(endorsement_length), float(coverage_price))
+        for commodity_code, type_code, state_code, endorsement_length, coverage_price in unique_keys
+    ]
+    return QuoteHistory(keys, np.asarray(unique_dates, dtype='datetime64[D]'), values)
+
+
+def load_quote_history(store_directory, start_date=None, end_date=None, commodity_code=None, type_code=None):
+    """
+    Build the history of the quote store, reading only the partitions it needs.
+
+    Args:
+        store_directory (str): Root directory of the quote store.
+        start_date (datetime.date): First sales effective date, or None for the earliest stored.
+        end_date (datetime.date): Last sales effective date, or None for the latest stored.
+        commodity_code (str): Commodity to load, or None for all.
+        type_code (str): Type to load, or None for all.
+
+    Returns:
+        QuoteHistory: The series.
+    """
+    filters = []
+    if start_date is not None:
+        filters.append(('sales_effective_date', '>=', start_date))
+    if end_date is not None:
+        filters.append(('sales_effective_date', '<=', end_date))
+    if commodity_code is not None:
+        filters.append(('commodity_code', '=', commodity_code))
+    if type_code is not None:
+        filters.append(('type_code', '=', type_code))
+    df = load_quotes(store_directory, filters=filters or None)
+    return build_quote_history(df)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show LRP premium trends from the quote store.")
+    parser.add_argument("--field", default='Cost Per Cwt Amount', choices=HISTORY_FIELDS, help="Value to follow")
+    parser.add_argument("--days", type=int, default=TREND_DAYS, help="Calendar days in the trend window")
+    parser.add_argument("--as-of", help="Last day of the window (YYYYMMDD, default: latest stored)")
+    parser.add_argument("--commodity", help="Commodity code, e.g. 0801")
+    parser.add_argument("--type", dest="type_code", help="Type code, e.g. 809")
+    parser.add_argument("--endorsement-length", type=int, help="Endorsement length in weeks")
+    parser.add_argument("--store-directory", default=QUOTE_STORE_DIRECTORY, help="Root directory of the quote store")
+    args = parser.parse_args()
+
+    as_of = datetime.datetime.strptime(args.as_of, "%Y%m%d").date() if args.as_of else None
+    start_date = as_of - datetime.timedelta(days=args.days - 1) if as_of else None
+    history = load_quote_history(args.store_directory, start_date, as_of, args.commodity, args.type_code)
+    trend = history.trend(args.field, args.days, as_of)
+    if args.endorsement_length is not None:
+        trend = trend[trend['endorsement_length'] == args.endorsement_length]
+    if trend.empty:
+        print("No quotes found.")
+    else:
+        print(trend.to_string(index=False, float_format=lambda value: f"{value:.4f}"))
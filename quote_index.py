@@ -0,0 +1,304 @@
+import argparse
+import bisect
+import datetime
+import os
+from collections import namedtuple
+from lrp_rate import published_values
+from main import QUOTE_STORE_DIRECTORY, TARGET_STATE_CODE, sheet_codes_for
+
+# One quoted row of a sheet
+Quote = namedtuple('Quote', [
+    'commodity_code', 'type_code', 'state_code', 'endorsement_length', 'coverage_price', 'coverage_level',
+    'expected_ending_value', 'premium', 'producer_premium',
+])
+
+# Columns holding each Quote field, in sheet DataFrames and in the quote store
+QUOTE_SOURCE_COLUMNS = {
+    'endorsement_length': 'Endorsement Length Count',
+    'coverage_price': 'Coverage Price',
+    'coverage_level': 'Livestock Coverage Level Percent',
+    'expected_ending_value': 'Expected Ending Value Amount',
+    'premium': 'Cost Per Cwt Amount',
+}
+PRODUCER_PREMIUM_COLUMNS = ('NewColumn', 'Producer Premium Amount')
+
+
+class QuoteIndex:
+    """
+    In-memory lookup of quotes by commodity, type, state and endorsement length.
+
+    Each (commodity, type, state, endorsement length) group keeps its quotes
+    sorted by coverage price and by coverage level, so exact and nearest
+    lookups are a dict lookup plus a binary search.
+    """
+
+    def __init__(self, quotes):
+        self._groups = {}
+        grouped = {}
+        for quote in quotes:
+            key = (quote.commodity_code, quote.type_code, quote.state_code, quote.endorsement_length)
+            grouped.setdefault(key, []).append(quote)
+        for key, group in grouped.items():
+            by_price = sorted(group, key=lambda quote: quote.coverage_price)
+            by_level = sorted(group, key=lambda quote: quote.coverage_level)
+            self._groups[key] = (
+                [quote.coverage_price for quote in by_price], by_price,
+                [quote.coverage_level for quote in by_level], by_level,
+            )
+
+    def __len__(self):
+        return sum(len(group[1]) for group in self._groups.values())
+
+    def keys(self):
+        """
+        List the indexed groups.
+
+        Returns:
+            list: (commodity code, type code, state code, endorsement length) tuples.
+        """
+        return sorted(self._groups)
+
+    def quotes(self, commodity_code, type_code, endorsement_length, state_code=TARGET_STATE_CODE):
+        """
+        Get every quote of a group, ordered by coverage price.
+
+        Args:
+            commodity_code (str): Commodity code.
+            type_code (str): Type code.
+            endorsement_length (int): Endorsement length in weeks.
+            state_code (str): State code.
+
+        Returns:
+            list: Quotes, empty if the group is not indexed.
+        """
+        group = self._groups.get((commodity_code, type_code, state_code, int(endorsement_length)))
+        return list(group[1]) if group else []
+
+    def lookup(self, commodity_code, type_code, endorsement_length, coverage_price, state_code=TARGET_STATE_CODE,
+               tolerance=1e-6):
+        """
+        Find the quote at an exact coverage price.
+
+        Args:
+            commodity_code (str): Commodity code.
+            type_code (str): Type code.
+            endorsement_length (int): Endorsement length in weeks.
+            coverage_price (float): Coverage price.
+            state_code (str): State code.
+            tolerance (float): Largest price difference still treated as a match.
+
+        Returns:
+            Quote: The quote, or None if there is none at that price.
+        """
+        quote = self.nearest_price(commodity_code, type_code, endorsement_length, coverage_price, state_code)
+        if quote is None or abs(quote.coverage_price - coverage_price) > tolerance:
+            return None
+        return quote
+
+    def nearest_price(self, commodity_code, type_code, endorsement_length, coverage_price,
+                      state_code=TARGET_STATE_CODE):
+        """
+        Find the quote with the coverage price closest to a target price.
+
+        Args:
+            commodity_code (str): Commodity code.
+            type_code (str): Type code.
+            endorsement_length (int): Endorsement length in weeks.
+            coverage_price (float): Target coverage price.
+            state_code (str): State code.
+
+        Returns:
+            Quote: The closest quote (the lower one on a tie), or None if the group is not indexed.
+        """
+        group = self._groups.get((commodity_code, type_code, state_code, int(endorsement_length)))
+        return nearest(group[0], group[1], coverage_price) if group else None
+
+    def nearest_level(self, commodity_code, type_code, endorsement_length, coverage_level,
+                      state_code=TARGET_STATE_CODE):
+        """
+        Find the quote with the coverage level closest to a target level.
+
+        Args:
+            commodity_code (str): Commodity code.
+            type_code (str): Type code.
+            endorsement_length (int): Endorsement length in weeks.
+            coverage_level (float): Target coverage level (0-1).
+            state_code (str): State code.
+
+        Returns:
+            Quote: The closest quote (the lower one on a tie), or None if the group is not indexed.
+        """
+        group = self._groups.get((commodity_code, type_code, state_code, int(endorsement_length)))
+        return nearest(group[2], group[3], coverage_level) if group else None
+
+
+def nearest(sorted_values, items, target):
+    """
+    Pick the item whose sorted value is closest to a target.
+
+    Args:
+        sorted_values (list): Values in ascending order.
+        items (list): Items in the same order as the values.
+        target (float): Target value.
+
+    Returns:
+        The closest item, the lower one on a tie.
+    """
+    position = bisect.bisect_left(sorted_values, target)
+    if position == 0:
+        return items[0]
+    if position == len(sorted_values):
+        return items[-1]
+    if target - sorted_values[position - 1] <= sorted_values[position] - target:
+        return items[position - 1]
+    return items[position]
+
+
+def frame_quotes(df, commodity_code, type_code, state_code):
+    """
+    Turn the rows of one sheet or store partition into Quotes.
+
+    Args:
+        df (pandas.DataFrame): Typed sheet DataFrame or stored quotes.
+        commodity_code (str): Commodity code.
+        type_code (str): Type code.
+        state_code (str): State code, used when the frame has no 'State Code' column.
+
+    Returns:
+        list: Quotes.
+    """
+    producer_premium_column = next(column for column in PRODUCER_PREMIUM_COLUMNS if column in df.columns)
+    columns = [published_values(df, column).tolist() for column in QUOTE_SOURCE_COLUMNS.values()]
+    columns.append(df[producer_premium_column].astype(float).tolist())
+    state_codes = df['State Code'].astype(str).tolist() if 'State Code' in df.columns else [state_code] * len(df)
+    return [
+        Quote(commodity_code, type_code, row_state_code, int(endorsement_length), coverage_price, coverage_level,
+              expected_ending_value, premium, producer_premium)
+        for row_state_code, endorsement_length, coverage_price, coverage_level, expected_ending_value, premium,
+        producer_premium in zip(state_codes, *columns)
+    ]
+
+
+def sheet_frames(commodity_dfs, outputs=None):
+    """
+    Pair each sheet DataFrame of a run with its codes.
+
+    Args:
+        commodity_dfs (list): List of tuples containing sheet names and corresponding DataFrames.
+        outputs (list): Outputs from output_matrix the DataFrames were built for, or None for every configured output.
+
+    Yields:
+        tuple: Commodity code, type code, state code and DataFrame of each sheet.
+    """
+    sheet_codes = sheet_codes_for(outputs)
+    for sheet_name, df in commodity_dfs:
+        commodity_code, state_code, type_code = sheet_codes[sheet_name]
+        yield commodity_code, type_code, state_code, df
+
+
+def build_quote_index(commodity_dfs, outputs=None):
+    """
+    Index the sheet DataFrames of a run.
+
+    Args:
+        commodity_dfs (list): List of tuples containing sheet names and corresponding DataFrames.
+        outputs (list): Outputs from output_matrix the DataFrames were built for, or None for every configured output.
+
+    Returns:
+        QuoteIndex: Index over every sheet.
+    """
+    quotes = []
+    for commodity_code, type_code, state_code, df in sheet_frames(commodity_dfs, outputs):
+        quotes.extend(frame_quotes(df, commodity_code, type_code, state_code))
+    return QuoteIndex(quotes)
+
+
+def latest_store_date(store_directory):
+    """
+    Find the most recent sales effective date in the quote store.
+
+    Args:
+        store_directory (str): Root directory of the quote store.
+
+    Returns:
+        datetime.date: Latest stored date, or None if the store is empty.
+    """
+    prefix = "sales_effective_date="
+    dates = [
+        datetime.date.fromisoformat(name[len(prefix):])
+        for name in (os.listdir(store_directory) if os.path.isdir(store_directory) else [])
+        if name.startswith(prefix)
+    ]
+    return max(dates, default=None)
+
+
+def stored_frames(store_directory, sales_effective_date=None):
+    """
+    Load one day of the quote store as one DataFrame per commodity and type.
+
+    Args:
+        store_directory (str): Root directory of the quote store.
+        sales_effective_date (datetime.date): Day to load, or None for the latest stored day.
+
+    Yields:
+        tuple: Commodity code, type code, state code and DataFrame of each stored partition. The
+            DataFrames keep their 'State Code' column; the state code is TARGET_STATE_CODE.
+    """
+    from quote_store import load_quotes
+
+    sales_effective_date = sales_effective_date or latest_store_date(store_directory)
+    if sales_effective_date is None:
+        return
+    df = load_quotes(store_directory, filters=[('sales_effective_date', '=', sales_effective_date)])
+    for (commodity_code, type_code), partition_df in df.groupby(['commodity_code', 'type_code'], observed=True):
+        yield commodity_code, type_code, TARGET_STATE_CODE, partition_df
+
+
+def load_quote_index(store_directory, sales_effective_date=None):
+    """
+    Index one day of the quote store.
+
+    Args:
+        store_directory (str): Root directory of the quote store.
+        sales_effective_date (datetime.date): Day to index, or None for the latest stored day.
+
+    Returns:
+        QuoteIndex: Index over every stored sheet of that day.
+    """
+    quotes = []
+    for commodity_code, type_code, state_code, df in stored_frames(store_directory, sales_effective_date):
+        quotes.extend(frame_quotes(df, commodity_code, type_code, state_code))
+    return QuoteIndex(quotes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Look up stored LRP quotes.")
+    parser.add_argument("commodity_code", help="Commodity code, e.g. 0801")
+    parser.add_argument("type_code", help="Type code, e.g. 809")
+    parser.add_argument("endorsement_length", type=int, help="Endorsement length in weeks")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--price", type=float, help="Quote with the coverage price nearest to this")
+    target.add_argument("--level", type=float, help="Quote with the coverage level nearest to this (0-1)")
+    parser.add_argument("--state", default=TARGET_STATE_CODE, help="State code")
+    parser.add_argument("--date", help="Sales effective date (YYYYMMDD, default: latest stored)")
+    parser.add_argument("--store-directory", default=QUOTE_STORE_DIRECTORY, help="Root directory of the quote store")
+    args = parser.parse_args()
+
+    sales_effective_date = datetime.datetime.strptime(args.date, "%Y%m%d").date() if args.date else None
+    quote_index = load_quote_index(args.store_directory, sales_effective_date)
+    if args.price is not None:
+        quotes = [quote_index.nearest_price(args.commodity_code, args.type_code, args.endorsement_length,
+                                            args.price, args.state)]
+    elif args.level is not None:
+        quotes = [quote_index.nearest_level(args.commodity_code, args.type_code, args.endorsement_length,
+                                            args.level, args.state)]
+    else:
+        quotes = quote_index.quotes(args.commodity_code, args.type_code, args.endorsement_length, args.state)
+    quotes = [quote for quote in quotes if quote is not None]
+    if not quotes:
+        print("No quotes found.")
+    for quote in quotes:
+        print(f"{quote.commodity_code} {quote.type_code} {quote.endorsement_length} weeks: "
+              f"coverage price {quote.coverage_price:.3f} ({quote.coverage_level:.2%}), "
+              f"expected ending value {quote.expected_ending_value:.3f}, "
+              f"premium {quote.premium:.3f}, producer premium {quote.producer_premium:.4f}")
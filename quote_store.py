@@ -0,0 +1,123 @@
+import datetime
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from atomic_file import replace_file
+
+# Partition columns, in directory nesting order; codes stay strings to keep leading zeros
+PARTITIONING = ds.partitioning(
+    pa.schema([
+        ('sales_effective_date', pa.date32()),
+        ('commodity_code', pa.string()),
+        ('type_code', pa.string()),
+    ]),
+    flavor='hive',
+)
+
+# Compact storage types for the sheet columns kept in the store
+QUOTE_SCHEMA = {
+    'State Code': 'category',
+    'Record Type Code': 'category',
+    'Endorsement Length Count': 'int16',
+    'Coverage Price': 'float32',
+    'Endorsement Length Code': 'category',
+    'Target Low Weight': 'float32',
+    'Target High Weight': 'float32',
+    'Expected Ending Value Amount': 'float32',
+    'Livestock Coverage Level Percent': 'float32',
+    'Livestock Rate': 'float32',
+    'Cost Per Cwt Amount': 'float32',
+    'Filing Date': 'date',
+    'Producer Premium Amount': 'float32',
+}
+
+# Sheet columns renamed on the way into the store
+STORE_COLUMN_NAMES = {'NewColumn': 'Producer Premium Amount'}
+
+
+def to_store_frame(df):
+    """
+    Convert a typed sheet DataFrame into the compact store schema.
+
+    Args:
+        df (pandas.DataFrame): Sheet DataFrame from commodity_sheet_build.
+
+    Returns:
+        pandas.DataFrame: DataFrame with categorical codes, float32 prices and dates.
+    """
+    df = df.rename(columns=STORE_COLUMN_NAMES)
+    store_df = pd.DataFrame(index=df.index)
+    for column, dtype in QUOTE_SCHEMA.items():
+        if column not in df.columns:
+            continue
+        if dtype == 'date':
+            store_df[column] = df[column].dt.date
+        else:
+            store_df[column] = df[column].astype(dtype)
+    return store_df.reset_index(drop=True)
+
+
+def partition_path(store_directory, sales_effective_date, commodity_code, type_code):
+    """
+    Build the directory of one store partition.
+
+    Args:
+        store_directory (str): Root directory of the quote store.
+        sales_effective_date (datetime.date): Sales effective date.
+        commodity_code (str): Commodity code.
+        type_code (str): Type code.
+
+    Returns:
+        str: Partition directory.
+    """
+    return os.path.join(
+        store_directory,
+        f"sales_effective_date={sales_effective_date.isoformat()}",
+        f"commodity_code={commodity_code}",
+        f"type_code={type_code}",
+    )
+
+
+def append_quotes(store_directory, date_str, partition_dfs):
+    """
+    Append one day's sheet DataFrames to the quote store.
+
+    Each (commodity, type) sheet becomes its own partition under the day's
+    sales effective date. Partitions are written to a temporary file and
+    moved into place, so re-running a day replaces it instead of duplicating it.
+
+    Args:
+        store_directory (str): Root directory of the quote store.
+        date_str (str): Sales effective date of the file (YYYYMMDD).
+        partition_dfs (dict): Sheet DataFrames keyed by (commodity code, type code).
+
+    Returns:
+        int: Number of rows stored.
+    """
+    sales_effective_date = datetime.datetime.strptime(date_str, "%Y%m%d").date()
+    row_count = 0
+    for (commodity_code, type_code), df in partition_dfs.items():
+        if df.empty:
+            continue
+        directory = partition_path(store_directory, sales_effective_date, commodity_code, type_code)
+        store_df = to_store_frame(df)
+        replace_file(os.path.join(directory, "part-0.parquet"),
+                     lambda temp_path: store_df.to_parquet(temp_path, engine='pyarrow', index=False))
+        row_count += len(df)
+    return row_count
+
+
+def load_quotes(store_directory, filters=None):
+    """
+    Load quotes across partitions, reading only those that pass the filters.
+
+    Args:
+        store_directory (str): Root directory of the quote store.
+        filters (list): pyarrow filter tuples on the partition columns, e.g. [('commodity_code', '=', '0801')].
+
+    Returns:
+        pandas.DataFrame: Stored quotes with the partition columns attached.
+    """
+    df = pd.read_parquet(store_directory, engine='pyarrow', filters=filters, partitioning=PARTITIONING)
+    return df.astype({'commodity_code': 'category', 'type_code': 'category'})
@@ -0,0 +1,184 @@
+import json
+import mmap
+import os
+import zipfile
+from atomic_file import replace_file
+
+# Extracted LrpRate file written next to each zip (or in a given cache directory), and its sidecar index
+RAW_CACHE_SUFFIX = "_LrpRate.txt"
+INDEX_SUFFIX = ".index.json"
+# Separator joining (commodity, state, type) codes into an index key
+BLOCK_KEY_SEPARATOR = "|"
+
+
+def block_key(partition_key):
+    """
+    Build the index key of a (commodity, state, type) block.
+
+    Args:
+        partition_key (tuple): (commodity, state, type) codes.
+
+    Returns:
+        str: Index key.
+    """
+    return BLOCK_KEY_SEPARATOR.join(partition_key)
+
+
+def build_raw_cache(zip_path, member, text_path, key_fields, validate_header):
+    """
+    Extract the LrpRate file next to its zip and index the byte ranges of each block.
+
+    The file is extracted and indexed in one pass. Consecutive rows with the
+    same (commodity, state, type) codes become one byte range; a block that
+    shows up in several places in the file gets several ranges. The header is
+    validated before any row is indexed, so a missing or repeated key column
+    stops the build instead of indexing the wrong field.
+
+    Args:
+        zip_path (str): Path to the ADM daily zip.
+        member (str): Name of the LrpRate member in the zip.
+        text_path (str): Where to extract the LrpRate file.
+        key_fields (tuple): Header names of the (commodity, state, type) fields.
+        validate_header (callable): Checks the header row and returns column name to position.
+
+    Returns:
+        dict: The index.
+    """
+    blocks = {}
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        info = zip_ref.getinfo(member)
+        with zip_ref.open(member) as raw_file:
+            header_line = raw_file.readline()
+            header = header_line.decode('utf-8').rstrip('\r\n').split('|')
+            positions = validate_header(header)
+            key_positions = [positions[name] for name in key_fields]
+
+            def extract(temp_path):
+                with open(temp_path, 'wb') as text_file:
+                    text_file.write(header_line)
+                    offset = len(header_line)
+                    current_ranges = None
+                    current_key = None
+                    for line in raw_file:
+                        text_file.write(line)
+                        start, offset = offset, offset + len(line)
+                        if not line.strip():
+                            continue
+                        fields = line.split(b'|')
+                        key = BLOCK_KEY_SEPARATOR.join(fields[pos].decode('utf-8') for pos in key_positions)
+                        if key == current_key and current_ranges[-1][1] == start:
+                            current_ranges[-1][1] = offset
+                            continue
+                        current_key = key
+                        current_ranges = blocks.setdefault(key, [])
+                        current_ranges.append([start, offset])
+
+            replace_file(text_path, extract)
+
+    index = {
+        'member': member,
+        'member_crc': info.CRC,
+        'member_size': info.file_size,
+        'header': header,
+        'data_start': len(header_line),
+        'blocks': blocks,
+    }
+
+    def write_index(temp_path):
+        with open(temp_path, 'w') as index_file:
+            json.dump(index, index_file)
+
+    # The extracted file goes in first, so an index on disk always describes a complete file
+    replace_file(text_path + INDEX_SUFFIX, write_index)
+    return index
+
+
+def load_raw_cache(zip_path, member, text_path):
+    """
+    Load the index of an extracted LrpRate file if it still matches the zip.
+
+    Args:
+        zip_path (str): Path to the ADM daily zip.
+        member (str): Name of the LrpRate member in the zip.
+        text_path (str): Path of the extracted LrpRate file.
+
+    Returns:
+        dict: The index, or None if the cache is missing or stale.
+    """
+    try:
+        with open(text_path + INDEX_SUFFIX, 'r') as index_file:
+            index = json.load(index_file)
+    except (OSError, ValueError):
+        return None
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        info = zip_ref.getinfo(member)
+    if (index.get('member') != member or index.get('member_crc') != info.CRC
+            or index.get('member_size') != info.file_size):
+        return None
+    if not os.path.exists(text_path) or os.path.getsize(text_path) != info.file_size:
+        return None
+    return index
+
+
+def open_raw_cache(zip_path, member, key_fields, validate_header, cache_directory=None):
+    """
+    Get the extracted LrpRate file of a zip and its block index, building them if needed.
+
+    Args:
+        zip_path (str): Path to the ADM daily zip.
+        member (str): Name of the LrpRate member in the zip.
+        key_fields (tuple): Header names of the (commodity, state, type) fields.
+        validate_header (callable): Checks the header row and returns column name to position.
+        cache_directory (str): Directory to extract into, or None for the zip's own directory.
+
+    Returns:
+        tuple: Path of the extracted LrpRate file and its index.
+    """
+    # Named after the zip rather than the member, so each zip gets its own cache
+    text_path = os.path.splitext(zip_path)[0] + RAW_CACHE_SUFFIX
+    if cache_directory is not None:
+        text_path = os.path.join(cache_directory, os.path.basename(text_path))
+    index = load_raw_cache(zip_path, member, text_path)
+    if index is None:
+        index = build_raw_cache(zip_path, member, text_path, key_fields, validate_header)
+    return text_path, index
+
+
+def block_ranges(index, partition_keys=None):
+    """
+    List the byte ranges to read for a set of blocks, in file order.
+
+    Args:
+        index (dict): Index from open_raw_cache.
+        partition_keys (set): (commodity, state, type) code tuples, or None for every row.
+
+    Returns:
+        list: (start, end) byte ranges.
+    """
+    if partition_keys is None:
+        return [(index['data_start'], index['member_size'])]
+    return sorted(
+        (start, end)
+        for partition_key in partition_keys
+        for start, end in index['blocks'].get(block_key(partition_key), [])
+    )
+
+
+def read_ranges(text_path, ranges):
+    """
+    Read byte ranges of an extracted LrpRate file through a memory map.
+
+    Only the pages under the requested ranges are read from disk and decoded.
+
+    Args:
+        text_path (str): Path of the extracted LrpRate file.
+        ranges (list): (start, end) byte ranges.
+
+    Yields:
+        str: Lines of the ranges, without line endings.
+    """
+    if not ranges:
+        return
+    with open(text_path, 'rb') as text_file, mmap.mmap(text_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for start, end in ranges:
+            yield from mapped[start:end].decode('utf-8').splitlines()
@@ -0,0 +1,61 @@
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+
+
+@contextmanager
+def shared_columns(column_names, columns):
+    """
+    Copy parsed columns into shared memory once for the lifetime of a block.
+
+    Each column's array is stored in its own shared memory block. Worker
+    processes attach to the blocks by name instead of receiving a pickled
+    copy of the data. Categorical columns share their codes; their few
+    categories travel with the descriptor.
+
+    Args:
+        column_names (list): Column names.
+        columns (list): Typed columns (numpy arrays or pandas.Categorical), all the same length.
+
+    Yields:
+        list: (column name, block name, length, dtype, categories) descriptors for attach_columns.
+    """
+    blocks = []
+    descriptors = []
+    try:
+        for name, values in zip(column_names, columns):
+            categories = None
+            if isinstance(values, pd.Categorical):
+                categories = list(values.categories)
+                values = values.codes
+            array = np.ascontiguousarray(values)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+            descriptors.append((name, block.name, len(array), array.dtype.str, categories))
+        yield descriptors
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+def attach_columns(descriptors):
+    """
+    Attach to columns published by shared_columns without copying them.
+
+    Args:
+        descriptors (list): Descriptors yielded by shared_columns.
+
+    Returns:
+        tuple: Open shared memory blocks (close them when done) and a dict of column name to
+            (array, categories), where categories is None unless the array holds categorical codes.
+    """
+    blocks = []
+    arrays = {}
+    for name, block_name, length, dtype, categories in descriptors:
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = (np.ndarray((length,), dtype=np.dtype(dtype), buffer=block.buf), categories)
+    return blocks, arrays
@@ -0,0 +1,87 @@
+import json
+import os
+import zipfile
+from archive import MANIFEST_FILENAME, archive_zip, load_manifest, object_path, prune
+from raw_cache import INDEX_SUFFIX, RAW_CACHE_SUFFIX
+
+DATES = ['20231213', '20231214', '20231215']
+
+
+def daily_filename(date_str):
+    return f"2024_ADMLivestockLrp_Daily_{date_str}.zip"
+
+
+def touch(path, content, mtime):
+    with open(path, 'w') as file:
+        file.write(content)
+    os.utime(path, (mtime, mtime))
+
+
+def setup_days(tmp_path):
+    # One archived zip per day, each with its extracted LrpRate file and index, oldest first
+    save_directory = str(tmp_path / 'var')
+    archive_directory = os.path.join(save_directory, 'archive')
+    os.makedirs(save_directory)
+    for day, date_str in enumerate(DATES):
+        zip_path = os.path.join(save_directory, daily_filename(date_str))
+        with zipfile.ZipFile(zip_path, 'w') as zip_ref:
+            zip_ref.writestr('2024_A00630_LrpRate_Daily.txt', f"rows of {date_str}\n" * 100)
+        archive_zip(archive_directory, zip_path, url=f"https://example.test/{daily_filename(date_str)}")
+        text_path = os.path.splitext(zip_path)[0] + RAW_CACHE_SUFFIX
+        touch(text_path, 'rows', 1_000_000 + day)
+        touch(text_path + INDEX_SUFFIX, '{}', 1_000_000 + day)
+    # A file extracted by hand, and a file prune has no business with
+    touch(os.path.join(save_directory, 'notes.txt'), 'extracted', 900_000)
+    touch(os.path.join(save_directory, 'download_cache.json'), '{}', 900_000)
+    return archive_directory, save_directory
+
+
+def object_size(archive_directory, date_str):
+    return load_manifest(archive_directory)[daily_filename(date_str)]['size']
+
+
+def test_prune_keeps_the_two_newest_raw_caches(tmp_path):
+    archive_directory, save_directory = setup_days(tmp_path)
+
+    counts = prune(archive_directory, save_directory)
+
+    assert sorted(os.listdir(save_directory)) == sorted([
+        'archive', 'download_cache.json',
+        *(daily_filename(date_str) for date_str in DATES),
+        *(f"2024_ADMLivestockLrp_Daily_{date_str}{RAW_CACHE_SUFFIX}{suffix}"
+          for date_str in DATES[1:] for suffix in ('', INDEX_SUFFIX)),
+    ])
+    # The oldest extracted file and its index, and the file extracted by hand
+    assert counts == {'extracted_files': 3, 'evicted_days': 0,
+                      'bytes_freed': len('rows') + len('{}') + len('extracted')}
+    assert not any(entry['evicted'] for entry in load_manifest(archive_directory).values())
+
+
+def test_prune_evicts_oldest_days_over_budget(tmp_path):
+    archive_directory, save_directory = setup_days(tmp_path)
+    manifest = load_manifest(archive_directory)
+    oldest, middle, latest = (manifest[daily_filename(date_str)] for date_str in DATES)
+    # Room for one day only: the two oldest go, the latest stays whatever its size
+    max_bytes = object_size(archive_directory, DATES[2])
+
+    counts = prune(archive_directory, save_directory, max_bytes=max_bytes)
+
+    manifest = load_manifest(archive_directory)
+    assert [manifest[daily_filename(date_str)]['evicted'] for date_str in DATES] == [True, True, False]
+    # Evicted days keep what is needed to fetch them again
+    assert manifest[daily_filename(DATES[0])]['sha256'] == oldest['sha256']
+    assert manifest[daily_filename(DATES[0])]['url'] == f"https://example.test/{daily_filename(DATES[0])}"
+    with open(os.path.join(archive_directory, MANIFEST_FILENAME)) as manifest_file:
+        assert json.load(manifest_file) == manifest
+
+    assert not os.path.exists(object_path(archive_directory, oldest['sha256']))
+    assert not os.path.exists(object_path(archive_directory, middle['sha256']))
+    assert os.path.exists(object_path(archive_directory, latest['sha256']))
+    assert [os.path.exists(os.path.join(save_directory, daily_filename(date_str))) for date_str in DATES] == [
+        False, False, True]
+    assert counts['evicted_days'] == 2
+    assert counts['bytes_freed'] == oldest['size'] + middle['size'] + len('rows') + len('{}') + len('extracted')
+
+    # Nothing is left to evict, even with no budget at all
+    assert prune(archive_directory, save_directory, max_bytes=0)['evicted_days'] == 0
+    assert os.path.exists(object_path(archive_directory, latest['sha256']))
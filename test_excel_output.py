@@ -0,0 +1,198 @@
+import os
+import zipfile
+import openpyxl
+import pandas as pd
+import pytest
+from excel_output import regenerate_workbook, update_sheet_rows
+
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PACKAGE_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+WORKSHEET_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml'
+
+# Sheet columns as main.py writes them, keyed the way main.DIFF_KEY_COLUMNS keys them
+SHEET_COLUMNS = ['Endorsement Length Count', 'Coverage Price', 'Cost Per Cwt Amount']
+KEY_COLUMNS = ['Endorsement Length Count', 'Coverage Price']
+
+# Parts of a small workbook laid out the way Excel saves one: shared strings, a
+# calculation chain, stored dimensions and a formula sheet reading a data sheet
+TEMPLATE_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        f'<Override PartName="/xl/worksheets/sheet1.xml" ContentType="{WORKSHEET_TYPE}"/>'
+        f'<Override PartName="/xl/worksheets/sheet2.xml" ContentType="{WORKSHEET_TYPE}"/>'
+        f'<Override PartName="/xl/worksheets/sheet3.xml" ContentType="{WORKSHEET_TYPE}"/>'
+        '<Override PartName="/xl/sharedStrings.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+        '<Override PartName="/xl/calcChain.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.calcChain+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><Relationships xmlns="{PACKAGE_REL_NS}">'
+        f'<Relationship Id="rId1" Type="{REL_NS}/officeDocument" Target="xl/workbook.xml"/></Relationships>'
+    ),
+    'xl/workbook.xml': (
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}">'
+        '<sheets><sheet name="Summary" sheetId="1" r:id="rId1"/><sheet name="809_Sheet" sheetId="2" r:id="rId2"/>'
+        '<sheet name="810_Sheet" sheetId="3" r:id="rId3"/></sheets><calcPr calcId="191029"/></workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><Relationships xmlns="{PACKAGE_REL_NS}">'
+        f'<Relationship Id="rId1" Type="{REL_NS}/worksheet" Target="worksheets/sheet1.xml"/>'
+        f'<Relationship Id="rId2" Type="{REL_NS}/worksheet" Target="worksheets/sheet2.xml"/>'
+        f'<Relationship Id="rId3" Type="{REL_NS}/worksheet" Target="/xl/worksheets/sheet3.xml"/>'
+        f'<Relationship Id="rId4" Type="{REL_NS}/sharedStrings" Target="sharedStrings.xml"/>'
+        f'<Relationship Id="rId5" Type="{REL_NS}/calcChain" Target="calcChain.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/sharedStrings.xml': (
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><sst xmlns="{MAIN_NS}" count="5" uniqueCount="5">'
+        '<si><t>Total</t></si><si><t>Name</t></si><si><t>Value</t></si><si><t>stale</t></si><si><t>Code</t></si>'
+        '</sst>'
+    ),
+    'xl/calcChain.xml': (
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><calcChain xmlns="{MAIN_NS}">'
+        '<c r="B1" i="1"/></calcChain>'
+    ),
+    # Formula sheet, copied as it is
+    'xl/worksheets/sheet1.xml': (
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><worksheet xmlns="{MAIN_NS}">'
+        '<dimension ref="A1:B1"/><sheetData><row r="1"><c r="A1" t="s"><v>0</v></c>'
+        "<c r=\"B1\"><f>SUM('809_Sheet'!B2:B100)</f><v>6</v></c></row></sheetData></worksheet>"
+    ),
+    # Data sheet whose stale rows are replaced
+    'xl/worksheets/sheet2.xml': (
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><worksheet xmlns="{MAIN_NS}">'
+        '<dimension ref="A1:B4"/><sheetViews><sheetView workbookViewId="0"/></sheetViews><sheetData>'
+        '<row r="1"><c r="A1" t="s"><v>1</v></c><c r="B1" t="s"><v>2</v></c></row>'
+        '<row r="2"><c r="A2" t="s"><v>3</v></c><c r="B2"><v>1</v></c></row>'
+        '<row r="3"><c r="A3" t="s"><v>3</v></c><c r="B3"><v>2</v></c></row>'
+        '<row r="4"><c r="A4" t="s"><v>3</v></c><c r="B4"><v>3</v></c></row>'
+        '</sheetData><pageMargins left="0.7" right="0.7" top="0.75" bottom="0.75" header="0.3" footer="0.3"/>'
+        '</worksheet>'
+    ),
+    # Data sheet with only its header row
+    'xl/worksheets/sheet3.xml': (
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><worksheet xmlns="{MAIN_NS}">'
+        '<dimension ref="A1"/><sheetData><row r="1"><c r="A1" t="s"><v>4</v></c></row></sheetData></worksheet>'
+    ),
+}
+
+
+def write_template(path):
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as zip_ref:
+        for part_name, data in TEMPLATE_PARTS.items():
+            zip_ref.writestr(part_name, data)
+    return str(path)
+
+
+def test_regenerate_workbook_keeps_template_and_replaces_data(tmp_path):
+    template_path = write_template(tmp_path / 'template.xlsx')
+    excel_file_path = str(tmp_path / 'LRP.xlsx')
+    sheet_dfs = [
+        ('809_Sheet', pd.DataFrame({'Name': ['a < b & "c"', 'plain'], 'Value': [1.25, 7]})),
+        ('810_Sheet', pd.DataFrame({'Code': ['0801', '0815', None]})),
+    ]
+
+    size = regenerate_workbook(template_path, excel_file_path, sheet_dfs)
+
+    assert size == os.path.getsize(excel_file_path)
+    assert [name for name in os.listdir(tmp_path) if name.endswith('.tmp') or '.tmp.' in name] == []
+    wb = openpyxl.load_workbook(excel_file_path)
+    assert wb.sheetnames == ['Summary', '809_Sheet', '810_Sheet']
+    # Shared strings of the header and formula sheets still resolve
+    assert wb['Summary']['A1'].value == 'Total'
+    assert wb['Summary']['B1'].value == "=SUM('809_Sheet'!B2:B100)"
+    assert list(wb['809_Sheet'].values) == [('Name', 'Value'), ('a < b & "c"', 1.25), ('plain', 7)]
+    assert list(wb['810_Sheet'].values) == [('Code',), ('0801',), ('0815',)]
+    assert wb['809_Sheet'].max_row == 3
+
+    with zipfile.ZipFile(excel_file_path) as zip_ref:
+        names = zip_ref.namelist()
+        workbook = zip_ref.read('xl/workbook.xml')
+        content_types = zip_ref.read('[Content_Types].xml')
+        rels = zip_ref.read('xl/_rels/workbook.xml.rels')
+        data_sheet = zip_ref.read('xl/worksheets/sheet2.xml')
+        unchanged = {name: zip_ref.read(name) for name in ('xl/sharedStrings.xml', 'xl/worksheets/sheet1.xml')}
+    assert 'xl/calcChain.xml' not in names
+    assert b'calcChain' not in content_types and b'calcChain' not in rels
+    assert b'<calcPr fullCalcOnLoad="1" calcId="191029"/>' in workbook
+    # The template's dimension described its stale rows
+    assert b'<dimension' not in data_sheet
+    assert b'<pageMargins' in data_sheet
+    assert unchanged == {name: TEMPLATE_PARTS[name].encode('utf-8') for name in unchanged}
+
+
+def test_regenerate_workbook_in_place_and_missing_sheet(tmp_path):
+    excel_file_path = write_template(tmp_path / 'LRP.xlsx')
+    regenerate_workbook(excel_file_path, excel_file_path, [('809_Sheet', pd.DataFrame({'Name': ['x'], 'Value': [2]}))])
+    assert list(openpyxl.load_workbook(excel_file_path)['809_Sheet'].values) == [('Name', 'Value'), ('x', 2)]
+
+    before = (tmp_path / 'LRP.xlsx').read_bytes()
+    with pytest.raises(KeyError):
+        regenerate_workbook(excel_file_path, excel_file_path, [('999_Sheet', pd.DataFrame({'Name': ['x']}))])
+    assert (tmp_path / 'LRP.xlsx').read_bytes() == before
+    assert os.listdir(tmp_path) == ['LRP.xlsx']
+
+
+def sheet_with_rows(rows):
+    wb = openpyxl.Workbook()
+    sheet = wb.active
+    sheet.title = '809_Sheet'
+    sheet.append(SHEET_COLUMNS)
+    for row in rows:
+        sheet.append(row)
+    return wb
+
+
+def update(previous_rows, rows):
+    wb = sheet_with_rows(previous_rows)
+    counts = update_sheet_rows(wb, '809_Sheet', pd.DataFrame(rows, columns=SHEET_COLUMNS), KEY_COLUMNS)
+    return list(wb['809_Sheet'].values), counts
+
+
+def test_update_sheet_rows_inserts_at_sorted_position():
+    rows, counts = update(
+        [('13', '222.160', '3.398'), ('13', '226.560', '4.563')],
+        [('13', '222.160', '3.398'), ('13', '224.360', '3.947'), ('13', '226.560', '4.563')])
+    assert rows == [tuple(SHEET_COLUMNS), ('13', '222.160', '3.398'), ('13', '224.360', '3.947'),
+                    ('13', '226.560', '4.563')]
+    assert counts == {'inserted': 1, 'updated': 0, 'deleted': 0, 'cells_written': 3}
+
+
+def test_update_sheet_rows_deletes_missing_keys():
+    rows, counts = update(
+        [('13', '222.160', '3.398'), ('13', '224.360', '3.947'), ('17', '222.160', '4.104')],
+        [('13', '222.160', '3.398'), ('17', '222.160', '4.104')])
+    assert rows == [tuple(SHEET_COLUMNS), ('13', '222.160', '3.398'), ('17', '222.160', '4.104')]
+    assert counts == {'inserted': 0, 'updated': 0, 'deleted': 1, 'cells_written': 0}
+
+
+def test_update_sheet_rows_writes_only_changed_cells():
+    rows, counts = update(
+        [('13', '222.160', '3.398'), ('13', '224.360', '3.947')],
+        [('13', '222.160', '3.512'), ('13', '224.360', '3.947')])
+    assert rows == [tuple(SHEET_COLUMNS), ('13', '222.160', '3.512'), ('13', '224.360', '3.947')]
+    assert counts == {'inserted': 0, 'updated': 1, 'deleted': 0, 'cells_written': 1}
+
+
+def test_update_sheet_rows_leaves_unchanged_sheet_alone():
+    previous_rows = [(13, 222.16, 0.1 + 0.2), (13, 224.36, 3.947)]
+    rows, counts = update(previous_rows, [(13, 222.16, 0.3), (13, 224.36, 3.947)])
+    # Float round-off is not a change
+    assert rows == [tuple(SHEET_COLUMNS), *previous_rows]
+    assert counts == {'inserted': 0, 'updated': 0, 'deleted': 0, 'cells_written': 0}
+
+
+def test_update_sheet_rows_creates_missing_sheet():
+    wb = sheet_with_rows([])
+    counts = update_sheet_rows(wb, '810_Sheet', pd.DataFrame([('13', '222.160', '3.398')], columns=SHEET_COLUMNS),
+                               KEY_COLUMNS)
+    assert list(wb['810_Sheet'].values)[1:] == [('13', '222.160', '3.398')]
+    assert counts == {'inserted': 1, 'updated': 0, 'deleted': 0, 'cells_written': 3}
@@ -0,0 +1,221 @@
+import asyncio
+import io
+import os
+import zipfile
+import pytest
+from download import fetch_cached_async, load_partial_validator, save_partial_validator
+from http_pool import ConnectionPool
+
+
+def make_zip():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as zip_ref:
+        zip_ref.writestr('2024_A00630_LrpRate_Daily.txt', os.urandom(20000))
+    return buffer.getvalue()
+
+
+ZIP_BYTES = make_zip()
+
+
+def response(status, body=b'', headers=None, reason='OK', content_length=True):
+    lines = [f"HTTP/1.1 {status} {reason}"]
+    if content_length:
+        lines.append(f"Content-Length: {len(body)}")
+    lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+
+class StandIn:
+    """
+    Local HTTP/1.1 server answering each request with handler(request) -> (response bytes, close after it).
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.connections = 0
+        self.requests = []
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self._serve, '127.0.0.1', 0)
+        self.url = f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/"
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.server.close()
+
+    async def _serve(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                lines = head.decode('latin-1').split('\r\n')
+                method, path, _ = lines[0].split(' ', 2)
+                headers = {}
+                for line in lines[1:]:
+                    if line:
+                        name, _, value = line.partition(':')
+                        headers[name.strip().lower()] = value.strip()
+                request = {'method': method, 'path': path, 'headers': headers}
+                self.requests.append(request)
+                data, close = self.handler(request)
+                writer.write(data)
+                await writer.drain()
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def serve_zip(request, etag='"v1"'):
+    # Full file, or the requested range when If-Range still matches
+    range_header = request['headers'].get('range')
+    if range_header and request['headers'].get('if-range') == etag:
+        start = int(range_header[len('bytes='):].rstrip('-'))
+        if start >= len(ZIP_BYTES):
+            return response(416, b'<html>range not satisfiable</html>', reason='Range Not Satisfiable'), False
+        return response(206, ZIP_BYTES[start:], {
+            'ETag': etag, 'Content-Range': f"bytes {start}-{len(ZIP_BYTES) - 1}/{len(ZIP_BYTES)}",
+        }, reason='Partial Content'), False
+    if request['headers'].get('if-none-match') == etag:
+        return response(304, content_length=False, reason='Not Modified'), False
+    return response(200, ZIP_BYTES, {'ETag': etag}), False
+
+
+def fetch(stand_in, save_directory, pool=None):
+    async def run():
+        if pool is not None:
+            return await fetch_cached_async(pool, stand_in.url + 'daily.zip', save_directory)
+        async with ConnectionPool(timeout=5) as own_pool:
+            return await fetch_cached_async(own_pool, stand_in.url + 'daily.zip', save_directory)
+    return run()
+
+
+def test_not_modified_reuses_cached_copy_and_connection(tmp_path):
+    async def run():
+        async with StandIn(serve_zip) as stand_in, ConnectionPool(timeout=5) as pool:
+            first = await fetch(stand_in, str(tmp_path), pool)
+            second = await fetch(stand_in, str(tmp_path), pool)
+            return stand_in, first, second
+
+    stand_in, (path, downloaded), (_, downloaded_again) = asyncio.run(run())
+    assert downloaded and not downloaded_again
+    assert stand_in.requests[1]['headers']['if-none-match'] == '"v1"'
+    # The 304 has no body, so the keep-alive connection carried both requests
+    assert stand_in.connections == 1
+    with open(path, 'rb') as file:
+        assert file.read() == ZIP_BYTES
+
+
+def test_resume_after_truncated_download(tmp_path):
+    half = len(ZIP_BYTES) // 2
+
+    def handler(request):
+        if len(stand_in.requests) == 1:
+            # Promise the whole file but close halfway through it
+            return response(200, ZIP_BYTES, {'ETag': '"v1"'})[:-(len(ZIP_BYTES) - half)], True
+        return serve_zip(request)
+
+    async def run():
+        nonlocal stand_in
+        async with StandIn(handler) as stand_in:
+            with pytest.raises(ConnectionError):
+                await fetch(stand_in, str(tmp_path))
+            partial_path = os.path.join(tmp_path, 'daily.zip.part')
+            assert os.path.getsize(partial_path) == half
+            assert load_partial_validator(partial_path) == '"v1"'
+            return await fetch(stand_in, str(tmp_path))
+
+    stand_in = None
+    path, downloaded = asyncio.run(run())
+    assert downloaded
+    assert stand_in.requests[1]['headers']['range'] == f"bytes={half}-"
+    assert stand_in.requests[1]['headers']['if-range'] == '"v1"'
+    with open(path, 'rb') as file:
+        assert file.read() == ZIP_BYTES
+    assert not os.path.exists(path + '.part')
+
+
+def test_changed_file_is_downloaded_whole_instead_of_resumed(tmp_path):
+    partial_path = os.path.join(tmp_path, 'daily.zip.part')
+    with open(partial_path, 'wb') as partial_file:
+        partial_file.write(b'stale bytes of an older file')
+    save_partial_validator(partial_path, '"v0"')
+
+    async def run():
+        async with StandIn(serve_zip) as stand_in:
+            return stand_in, await fetch(stand_in, str(tmp_path))
+
+    stand_in, (path, downloaded) = asyncio.run(run())
+    assert downloaded
+    assert stand_in.requests[0]['headers']['if-range'] == '"v0"'
+    with open(path, 'rb') as file:
+        assert file.read() == ZIP_BYTES
+
+
+def test_unsatisfiable_range_starts_over_on_the_same_connection(tmp_path):
+    partial_path = os.path.join(tmp_path, 'daily.zip.part')
+    with open(partial_path, 'wb') as partial_file:
+        partial_file.write(b'x' * (len(ZIP_BYTES) + 10))
+    save_partial_validator(partial_path, '"v1"')
+
+    async def run():
+        async with StandIn(serve_zip) as stand_in:
+            return stand_in, await fetch(stand_in, str(tmp_path))
+
+    stand_in, (path, downloaded) = asyncio.run(run())
+    assert downloaded
+    assert [request['headers'].get('range') for request in stand_in.requests] == [
+        f"bytes={len(ZIP_BYTES) + 10}-", None]
+    # The 416 body was read, so the retry reused the connection
+    assert stand_in.connections == 1
+    with open(path, 'rb') as file:
+        assert file.read() == ZIP_BYTES
+
+
+def test_truncated_chunked_body_raises():
+    def handler(request):
+        return b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nhello\r\n', True
+
+    async def run():
+        async with StandIn(handler) as stand_in, ConnectionPool(timeout=5) as pool:
+            response = await pool.request('GET', stand_in.url)
+            await response.read()
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(run())
+
+
+def test_chunked_body_is_read_whole():
+    def handler(request):
+        return b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nhello\r\n6\r\n world\r\n0\r\n\r\n', False
+
+    async def run():
+        async with StandIn(handler) as stand_in, ConnectionPool(timeout=5) as pool:
+            first = await (await pool.request('GET', stand_in.url)).read()
+            second = await (await pool.request('GET', stand_in.url)).read()
+            return stand_in, first, second
+
+    stand_in, first, second = asyncio.run(run())
+    assert first == second == b'hello world'
+    assert stand_in.connections == 1
+
+
+def test_malformed_status_line_frees_its_slot():
+    def handler(request):
+        if len(stand_in.requests) <= 2:
+            return b'garbage\r\n\r\n', True
+        return response(200, b'ok'), False
+
+    async def run():
+        nonlocal stand_in
+        async with StandIn(handler) as stand_in, ConnectionPool(max_connections_per_host=1, timeout=5) as pool:
+            for _ in range(2):
+                with pytest.raises(ConnectionError):
+                    await pool.request('GET', stand_in.url)
+            # With a leaked slot this would wait forever
+            return await asyncio.wait_for((await pool.request('GET', stand_in.url)).read(), 5)
+
+    stand_in = None
+    assert asyncio.run(run()) == b'ok'
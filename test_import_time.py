@@ -0,0 +1,6 @@
+from benchmark import IMPORT_TIME_BUDGET_SECONDS, measure_import_seconds
+
+
+def test_main_imports_within_budget():
+    # Heavy libraries must stay inside the functions that use them
+    assert measure_import_seconds('main') <= IMPORT_TIME_BUDGET_SECONDS